@@ -1,20 +1,23 @@
 import json
-from threading import Thread
+import traceback
+from threading import (RLock, Thread)
 
-from flask import (Flask, request, render_template, Response, redirect)
+from flask import (Flask, request, render_template, Response, redirect, stream_with_context)
 
-import app_tasks
 import config
-from core.api import accepts_json, PostgresAPI, MongoAPI
-from core.engine.msg_engine import MessageEngine
-from core.parsers import (TextParser)
+from core.api import accepts_json, accepts_stream, PostgresAPI, MongoAPI, STREAM_FORMATS
+from core.engine import (AnswerCache, EntityIndex, FrameCache, MessageEngine, PostingsIndex)
+from core.parsers import (TextParser, nlp)
 from core.services import StanfordServer
 
 API_COMMANDS = [
     {'url': '/', 'request': 'GET', 'function': 'This Page'},
     {'url': '/content', 'request': 'GET', 'function': 'Ask Question'},
+    {'url': '/content?stream=sse', 'request': 'GET', 'function': 'Ask Question (Streamed Answers)'},
     {'url': '/content', 'request': 'POST', 'function': 'Ask Question Through WebHook'},
     {'url': '/populate', 'request': 'GET', 'function': 'Populate KB'},
+    {'url': '/populate?resume=false', 'request': 'GET', 'function': 'Populate KB (Discarding An Interrupted Run)'},
+    {'url': '/populate?mode=incremental', 'request': 'GET', 'function': 'Update KB With New Or Changed Documents'},
     {'url': '/display', 'request': 'GET', 'function': 'Display KB Content'},
     {'url': '/progress', 'request': 'GET', 'function': 'Display Populate Progress'},
 ]
@@ -25,15 +28,35 @@ class App(Flask):
         super().__init__(import_name)
         self.config['SECRET_KEY'] = config.saml['secret_key']
         self.config['SAML_PATH'] = config.saml['saml_path']
+        nlp.set_pos_tagger(config.tagger['backend'])
         self.mongo_api = MongoAPI()
-        self.frame_dict = self.mongo_api.load_frame_cache(self.mongo_api.FRAMES)
-        self.postgres_api = PostgresAPI(database="semantic_kb")
-        self.message_engine = MessageEngine(self.postgres_api, self.frame_dict)
-        self.cache = []
+        self.frame_dict = FrameCache(config.frame_cache['max_size'], self.mongo_api.load_frame_cache(
+            self.mongo_api.FRAMES, config.frame_cache['flush_delay'], config.frame_cache['max_flush_delay']))
+        self.postgres_api = PostgresAPI(database="semantic_kb",
+                                        pool_size=(config.postgres_pool['min_size'], config.postgres_pool['max_size']))
+        self.answer_cache = AnswerCache(config.answer_cache['max_size'], config.answer_cache['ttl']) \
+            if config.answer_cache['max_size'] > 0 else None
+        self.message_engine = MessageEngine(self.postgres_api, self.frame_dict, self.answer_cache)
+        # AsyncPostgresAPI of the asyncio serving mode (see asgi.py), which shares the in-memory indexes
+        self.async_postgres_api = None
+        # version of the KB the indexes were loaded from (see check_kb_version)
+        self.kb_version = None
+        self.kb_lock = RLock()
+        self.load_indexes()
         self.status = 0
         self.populate_content_progress = (100, 0)
         self.populate_frames_progress = (100, 0)
 
+        @self.before_request
+        def check_kb_version():
+            # another worker may have populated the KB since the indexes of this one were loaded
+            self.check_kb_version(self.postgres_api.get_kb_version())
+
+        @self.teardown_request
+        def release_connection(exception):
+            # return the connection checked out by this request (if any) to the pool
+            self.postgres_api.release()
+
         @self.route('/', methods=['GET'])
         def home_page():
             return render_template('home.html', commands=API_COMMANDS)
@@ -65,16 +88,17 @@ class App(Flask):
             is_json = accepts_json(request)
             try:
                 question = request.args.get('question')
+                # stream each answer as soon as it is produced if requested
+                stream = accepts_stream(request)
+                if stream is not None:
+                    return Response(stream_with_context(self.stream_answers(question, stream)),
+                                    mimetype=STREAM_FORMATS[stream],
+                                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
                 answers = [
                     {'heading': heading, 'url': url, 'score': round(score, 2), 'answer': answer}
                     for heading, url, score, answer in self.message_engine.process_and_answer(question)
                 ] if question is not None else []
 
-                def persist_frames():
-                    self.mongo_api.persist_frame_cache(self.mongo_api.FRAMES, self.frame_dict)
-
-                Thread(target=persist_frames).start()
-
                 # output the answers
                 if is_json:
                     return json.dumps({
@@ -109,30 +133,168 @@ class App(Flask):
 
         @self.route('/populate', methods=['GET'])
         def populate():
+            # imported on first use, as app_tasks is only needed to populate the KB
+            import app_tasks
+
             if self.status != 1:
                 self.status = 1
 
+                # an interrupted run is resumed from its last checkpoint, unless requested otherwise
+                resume = request.args.get('resume') != 'false'
+
                 # method to run a complete init
                 def full_init():
+                    # the maintenance KB is opened per run, and only by one process at a time
+                    if app_tasks.open_maintenance_api() is None:
+                        print('The KB is being populated by another process')
+                        self.status = 0
+                        return
+                    try:
+                        self.populate_content_progress = (0, 0)
+                        self.populate_frames_progress = (0, 0)
+                        app_tasks.populate_content(self, resume=resume)
+                        self.populate_content_progress = (100, 0)
+                        app_tasks.populate_frames(self)
+                        self.populate_frames_progress = (100, 0)
+                        app_tasks.populate_heading_features(self)
+                        app_tasks.finalize(self)
+                        self.frame_dict.flush()
+                    except Exception:
+                        # a failed run is resumed from its last checkpoint by the next /populate
+                        print('Populate failed:')
+                        traceback.print_exc()
+                    finally:
+                        app_tasks.close_maintenance_api()
+                        self.status = 0
+
+                # method to re-ingest only new or changed documents (falls back to a complete init if the KB does
+                # not track the documents it was populated from)
+                def incremental_init():
                     self.populate_content_progress = (0, 0)
                     self.populate_frames_progress = (0, 0)
-                    app_tasks.populate_content(self)
-                    self.populate_content_progress = (100, 0)
-                    app_tasks.populate_frames(self)
-                    self.populate_frames_progress = (100, 0)
-                    self.status = 0
-                    app_tasks.finalize()
-                    self.mongo_api.persist_frame_cache(self.mongo_api.FRAMES, self.frame_dict)
-
-                Thread(target=full_init).start()
+                    try:
+                        if not app_tasks.populate_incremental(self):
+                            full_init()
+                            return
+                        self.frame_dict.flush()
+                    except Exception:
+                        print('Incremental populate failed:')
+                        traceback.print_exc()
+                    finally:
+                        self.status = 0
+
+                if request.args.get('mode') == 'incremental':
+                    Thread(target=incremental_init).start()
+                else:
+                    Thread(target=full_init).start()
             return redirect('/progress')
 
         @self.route('/progress', methods=['GET'])
         def progress():
             return render_template('progress.html')
 
+    def stream_answers(self, question: str, stream: str) -> next:
+        """
+    Answer a question, and serialize each answer as soon as it is produced
+        :param question: input question
+        :param stream: 'sse' to emit server-sent events (followed by a "done" or "error" event), or 'ndjson' to emit
+        one JSON object per line
+        :return: generator of serialized answers
+        """
+        def serialize(data: dict, event: str = None) -> str:
+            if stream == 'ndjson':
+                return '%s\n' % json.dumps(data)
+            return '%sdata: %s\n\n' % ('' if event is None else 'event: %s\n' % event, json.dumps(data))
+
+        try:
+            if question is not None:
+                for heading, url, score, answer in self.message_engine.process_and_answer(question, stream=True):
+                    yield serialize({'heading': heading, 'url': url, 'score': round(score, 2), 'answer': answer})
+            if stream == 'sse':
+                yield serialize({'question': question}, 'done')
+        except IOError as ex:
+            print(ex)
+            yield serialize({'error': str(ex)}, 'error')
+
+    def refresh_kb(self):
+        # called after the production KB is replaced or updated. drop everything derived from the old KB
+        with self.kb_lock:
+            if self.answer_cache is not None:
+                self.answer_cache.clear()
+            self.load_indexes()
+
+    def check_kb_version(self, version: str):
+        """
+    Drop everything derived from the KB if its version changed since the indexes were loaded (i.e. if another worker
+    populated it)
+        :param version: current version of the production KB
+        """
+        if version == self.kb_version:
+            return
+        with self.kb_lock:
+            # the indexes may have been reloaded while waiting for the lock
+            if version != self.kb_version:
+                self.refresh_kb()
+
+    def load_indexes(self):
+        # (re)load the in-memory indexes from the production KB. the version is read first, so that changes committed
+        # while loading are picked up by the next version check
+        self.kb_version = self.postgres_api.get_kb_version()
+        # the new KB may not have the same indexes, so resolve the fuzzy match mode again on the next match
+        self.postgres_api.match_mode = None
+        if config.indexes['entities']:
+            self.postgres_api.entity_index = EntityIndex(self.postgres_api.get_all_entities())
+            print('Entity index loaded (%d entities)' % len(self.postgres_api.entity_index))
+        if config.indexes['postings']:
+            self.postgres_api.postings_index = PostingsIndex(*self.postgres_api.get_postings_snapshot())
+            print('Postings index loaded (%d entities)' % len(self.postgres_api.postings_index))
+        if config.indexes['heading_features']:
+            self.message_engine.heading_features = self.postgres_api.get_heading_features()
+            print('Heading features loaded (%d headings)' % len(self.message_engine.heading_features))
+        self.share_indexes()
+        # the indexes may be loaded outside of a request, so return the connection used to load them
+        self.postgres_api.release()
+
+    def share_indexes(self):
+        # point the asyncio KB api (if any) to the in-memory indexes of the KB api, and resolve its fuzzy match mode
+        # again
+        if self.async_postgres_api is not None:
+            self.async_postgres_api.match_mode = None
+            self.async_postgres_api.entity_index = self.postgres_api.entity_index
+            self.async_postgres_api.postings_index = self.postgres_api.postings_index
+
+    def before_fork(self):
+        """
+    Close the connections opened while loading the app, so that none of them is shared by forked workers. The
+    frame cache, indexes and heading features stay loaded, and are shared copy-on-write
+        """
+        # flush the frame cache and stop its flusher (workers start their own on first write)
+        self.frame_dict.stop()
+        # close the maintenance KB api of a populate run (if any)
+        import app_tasks
+        app_tasks.close_maintenance_api()
+        self.postgres_api.release()
+        if self.postgres_api.pool is not None:
+            self.postgres_api.pool.close()
+        self.mongo_api.close()
+        nlp.get_pos_tagger().close()
+
+    def after_fork(self, tagger_port: int = None):
+        """
+    Open the connections of a forked worker. Postgres connections are opened by the pool when first checked out
+        :param tagger_port: port of the Stanford server used by this worker (if the tagger backend requires it)
+        """
+        self.mongo_api.connect()
+        if nlp.get_pos_tagger().requires_server:
+            options = {} if tagger_port is None else {'port': tagger_port}
+            nlp.set_pos_tagger(config.tagger['backend'], **options)
+
     def start(self):
-        with StanfordServer():
+        # the stanford server is only needed if the pos-tagger backend talks to it
+        if nlp.get_pos_tagger().requires_server:
+            with StanfordServer():
+                self.run(host="0.0.0.0")
+        else:
             self.run(host="0.0.0.0")
 
 
@@ -1,35 +1,44 @@
 # Insert passed headings and sentences into KB
 from datetime import datetime
+from itertools import islice
+from multiprocessing import Pool
 
-from app import App
-from core.api import PostgresAPI
-from core.engine import doc_engine
-from core.parsers import TextParser
+import config
+from core.api import (BulkWriter, PostgresAPI)
+from core.engine import (MessageEngine, doc_engine)
+from core.parsers import (TextParser, nlp)
 
+CHECKPOINT_CONTENT = 'content'
+CHECKPOINT_FRAMES = 'frames'
+POPULATE_LOCK_KEY = 5173
 SMOOTHING_FACTOR = 0.05
 SPLIT_CHAR = '__'
-POSTGRES_API = PostgresAPI(maintenance=True)
-
-
-def __process_content(app: App, headings: list, sentences: list):
-    def __process_sentences(sents: list, h_id: int):
-        # sentence parsing logic
-        for sentence in sents:
-            for pos_tags in TextParser.generate_pos_tag_sets(sentence):
-                entities = TextParser.extract_entities(pos_tags)
-                sentence = ' '.join(('%s%s%s' % (token, SPLIT_CHAR, pos) for token, pos in pos_tags))
-                # add result to cache
-                app.cache += [(sentence, entities, [], h_id)]
-
-    # insert all headings and get the immediate heading id
-    heading_id = POSTGRES_API.insert_headings(headings)
-    # insert the sentences using that heading id
-    __process_sentences(sentences, heading_id)
-    # persist cache in database
-    if len(app.cache) > 0:
-        for s, n, d, h in app.cache:
-            POSTGRES_API.insert_sentence(s, n, d, h)
-        app.cache.clear()
+# maintenance KB api of the populate run of this process (see open_maintenance_api)
+POSTGRES_API = None
+
+
+def open_maintenance_api() -> PostgresAPI:
+    """
+Open the maintenance KB api of a populate run, and lock populating the KB against other processes (i.e. other
+workers) until the api is closed with close_maintenance_api
+    :return: PostgresAPI of the maintenance schema, or None if another process is populating the KB
+    """
+    global POSTGRES_API
+    if POSTGRES_API is None:
+        api = PostgresAPI(maintenance=True)
+        if not api.try_advisory_lock(POPULATE_LOCK_KEY):
+            api.conn.close()
+            return None
+        POSTGRES_API = api
+    return POSTGRES_API
+
+
+def close_maintenance_api():
+    # close the maintenance KB api (if open), which also releases the populate lock
+    global POSTGRES_API
+    if POSTGRES_API is not None:
+        api, POSTGRES_API = POSTGRES_API, None
+        api.conn.close()
 
 
 def __calculate_progress(current: int, total: int, start_time: datetime, p_timestamp: datetime):
@@ -50,48 +59,219 @@ def __calculate_progress(current: int, total: int, start_time: datetime, p_times
     return c_timestamp, c_percent, est_time
 
 
-# populate the database with sentences and entities
-def populate_content(app: App) -> next:
+def __init_worker(backend: str):
+    # pos-tagger connections inherited from the parent process must not be shared, so open new ones
+    if nlp.get_pos_tagger().requires_server:
+        nlp.set_pos_tagger(backend)
+
+
+def __parse_document(data: dict) -> tuple:
+    # strip markdown, split sentences, pos-tag and extract entities of one document (runs in a worker process)
+    sections = []
+    for heading_list, sentences in doc_engine.get_doc_sections(data):
+        parsed = []
+        # pos-tag all sentences of the section in one batch
+        for pos_tags in nlp.pos_tag_many([sent for sentence in sentences for sent in nlp.sent_tokenize(sentence)]):
+            entities = TextParser.extract_entities(pos_tags)
+            sentence = ' '.join(('%s%s%s' % (token, SPLIT_CHAR, pos) for token, pos in pos_tags))
+            parsed += [(sentence, entities)]
+        sections += [(heading_list, parsed)]
+    return data['_id'], doc_engine.get_doc_hash(data), sections
+
+
+def __parse_documents(documents, workers: int) -> next:
+    # parse documents in a process pool (or in this process if workers is 1), and yield the results in document order
+    if workers > 1:
+        # imap reads all of its input at once, so documents are fed to it in bounded windows
+        window = workers * config.ingestion['chunk_size'] * config.ingestion['window_chunks']
+        documents = iter(documents)
+        with Pool(workers, initializer=__init_worker, initargs=(config.tagger['backend'],)) as pool:
+            while True:
+                batch = list(islice(documents, window))
+                if len(batch) == 0:
+                    break
+                yield from pool.imap(__parse_document, batch, config.ingestion['chunk_size'])
+    else:
+        yield from map(__parse_document, documents)
+
+
+def __write_document(doc_id: str, sections: list, writer: BulkWriter):
+    # single writer for the parsed documents. called in document order to keep sentence ids of a section adjacent
+    for heading_list, parsed in sections:
+        heading_id = writer.insert_headings(heading_list)
+        for sentence, entities in parsed:
+            writer.add_sentence(sentence, entities, [], heading_id, doc_id)
+
+
+def __commit_content(writer: BulkWriter, hashes: dict, last_id: str, done: bool = False):
+    # write the staged sentences and hashes of the documents parsed so far, and commit them along with a checkpoint
+    writer.flush()
+    POSTGRES_API.upsert_document_hashes(hashes)
+    hashes.clear()
+    POSTGRES_API.set_checkpoint(CHECKPOINT_CONTENT, last_id, done)
+    POSTGRES_API.conn.commit()
+
+
+# populate the database with sentences and entities. an unfinished run is resumed from its last checkpoint, unless
+# resume is False
+def populate_content(app: 'App', workers: int = config.ingestion['workers'], resume: bool = True) -> next:
     start_time = datetime.now()
     timestamp = start_time
+    checkpoint = POSTGRES_API.get_checkpoint(CHECKPOINT_CONTENT) if resume else None
+    if checkpoint is not None and checkpoint[1]:
+        print('Content already populated')
+        return
+    last_id = None if checkpoint is None else checkpoint[0]
+    if last_id is None:
+        POSTGRES_API.initialize_db()
+    else:
+        print('Resuming after document %s' % last_id)
+    # documents are processed in _id order, so the documents left are the ones after the checkpoint
+    count = app.mongo_api.get_document_count(app.mongo_api.SCRAPED_DOCS) if last_id is None else \
+        app.mongo_api.get_document_count(app.mongo_api.SCRAPED_DOCS, {'_id': {'$gt': last_id}})
     i = 0
-    POSTGRES_API.initialize_db()
-    count = app.mongo_api.get_document_count(app.mongo_api.SCRAPED_DOCS)
+    hashes = {}
 
-    for heading_list, flattened_sentences in doc_engine.get_doc_content(app.mongo_api):
-        # catch end of document
-        if heading_list is None and flattened_sentences is None:
+    with POSTGRES_API.bulk_writer() as writer:
+        # parse documents in worker processes, and write the results from this process in document order
+        documents = app.mongo_api.get_documents_after(app.mongo_api.SCRAPED_DOCS, last_id)
+        for doc_id, content_hash, sections in __parse_documents(documents, workers):
+            __write_document(doc_id, sections, writer)
+            # record the content hash of each document, for later incremental runs
+            hashes[doc_id] = content_hash
+            last_id = doc_id
+            if len(hashes) >= config.ingestion['checkpoint_documents']:
+                __commit_content(writer, hashes, last_id)
             timestamp, percent, est_time = __calculate_progress(i + 1, count, start_time, timestamp)
             app.populate_content_progress = (percent, est_time)
             i += 1
-        # insert content
-        else:
-            __process_content(app, heading_list, flattened_sentences)
-    # Commit changes to KB
-    POSTGRES_API.conn.commit()
+        # Commit changes to KB
+        __commit_content(writer, hashes, last_id, True)
     completion_time = datetime.now()
     app.populate_content_progress = (100, 0)
     print('Done! (time taken: %s seconds)' % (completion_time - start_time).seconds)
 
 
-# Generate frames for KB sentences to create semantics
-def populate_frames(app: App):
+def __commit_frames(postings: dict, last_id: int, done: bool = False):
+    # write the frame postings of the sentences processed so far, and commit them along with a checkpoint
+    POSTGRES_API.insert_frame_postings(postings)
+    postings.clear()
+    POSTGRES_API.set_checkpoint(CHECKPOINT_FRAMES, last_id, done)
+    POSTGRES_API.conn.commit()
+
+
+# Generate frames for KB sentences to create semantics. an unfinished run is resumed from its last checkpoint
+def populate_frames(app: 'App'):
     start_time = datetime.now()
     timestamp = start_time
-    count = POSTGRES_API.get_sentence_count()
-    app.frame_dict = app.mongo_api.load_frame_cache(app.mongo_api.FRAMES)
-    for i, (sentence_id, sentence_pos) in enumerate(POSTGRES_API.get_all_sentences()):
-        sent_frames = TextParser.get_frames(sentence_pos, app.frame_dict)
-        POSTGRES_API.insert_frames(sentence_id, sent_frames)
+    checkpoint = POSTGRES_API.get_checkpoint(CHECKPOINT_FRAMES)
+    if checkpoint is not None and checkpoint[1]:
+        print('Frames already populated')
+        return
+    # sentences are processed in id order, so the sentences left are the ones after the checkpoint
+    last_id = 0 if checkpoint is None else int(checkpoint[0])
+    count = POSTGRES_API.get_sentence_count(last_id)
+    # build frame -> sentence_ids postings in memory, and write each frame once per batch of sentences
+    postings = {}
+    for i, (sentence_id, sentence_pos) in enumerate(POSTGRES_API.get_all_sentences(last_id)):
+        for frame in TextParser.get_frames(sentence_pos, app.frame_dict):
+            postings.setdefault(frame, []).append(sentence_id)
+        last_id = sentence_id
+        if (i + 1) % config.ingestion['checkpoint_sentences'] == 0:
+            __commit_frames(postings, last_id)
         timestamp, percent, est_time = __calculate_progress(i + 1, count, start_time, timestamp)
         app.populate_frames_progress = (percent, est_time)
     # commit changes to KB
-    POSTGRES_API.conn.commit()
+    __commit_frames(postings, last_id, True)
     completion_time = datetime.now()
     app.populate_frames_progress = (100, 0)
     print('Done! (time taken: %s seconds)' % (completion_time - start_time).seconds)
 
 
-# If in maintenance mode, commit the changes to production database
-def finalize():
+# Precompute the features of every heading used for scoring, so that answering does not pos-tag headings
+def populate_heading_features(app: 'App', api: PostgresAPI = None):
+    start_time = datetime.now()
+    api = POSTGRES_API if api is None else api
+    timestamp = start_time
+    headings = api.get_distinct_headings()
+    # only headings added since the last run need their features computed
+    existing = api.get_heading_features()
+    features = {}
+    for i, heading in enumerate(headings):
+        # headings are scored one level at a time (split on ' > '), so store the features of each level
+        for segment in heading.split(' > '):
+            if segment not in features and segment not in existing:
+                features[segment] = MessageEngine.extract_heading_features(segment, app.frame_dict)
+        timestamp, percent, est_time = __calculate_progress(i + 1, len(headings), start_time, timestamp)
+    api.insert_heading_features(features)
+    # commit changes to KB
+    api.conn.commit()
+    completion_time = datetime.now()
+    print('Done! (time taken: %s seconds)' % (completion_time - start_time).seconds)
+
+
+# If in maintenance mode, commit the changes to production database, and refresh whatever the app derived from it
+def finalize(app: 'App'):
     POSTGRES_API.commit()
+    app.refresh_kb()
+
+
+# Re-ingest only the documents added, changed or removed since the last populate, directly in the production KB.
+# Returns False (without changing the KB) if the KB does not track document hashes, and needs a full populate instead.
+# Returns True without changing the KB if another process is populating it
+def populate_incremental(app: 'App', workers: int = config.ingestion['workers']) -> bool:
+    start_time = datetime.now()
+    timestamp = start_time
+    api = PostgresAPI()
+    try:
+        # full and incremental runs of other processes write the same KB
+        if not api.try_advisory_lock(POPULATE_LOCK_KEY):
+            print('The KB is being populated by another process')
+            return True
+        # KBs populated before document tracking was introduced get the tables, but no hashes
+        api.create_schema()
+        known_hashes = api.get_document_hashes()
+        if len(known_hashes) == 0:
+            api.conn.rollback()
+            return False
+
+        # find new and changed documents by their content hash
+        hashes = {}
+        for data in app.mongo_api.get_all_documents(app.mongo_api.SCRAPED_DOCS):
+            hashes[data['_id']] = doc_engine.get_doc_hash(data)
+        changed_ids = sorted(doc_id for doc_id in hashes if known_hashes.get(doc_id) != hashes[doc_id])
+        removed_ids = sorted(doc_id for doc_id in known_hashes if doc_id not in hashes)
+        print('%d new or changed, %d removed of %d documents' % (len(changed_ids), len(removed_ids), len(hashes)))
+
+        # delete the sentences, normalizations and frame postings of changed and removed documents
+        api.delete_documents([doc_id for doc_id in changed_ids if doc_id in known_hashes] + removed_ids)
+
+        # re-ingest new and changed documents
+        with api.bulk_writer() as writer:
+            documents = app.mongo_api.get_documents_by_ids(app.mongo_api.SCRAPED_DOCS, changed_ids)
+            parsed = __parse_documents(documents, min(workers, max(len(changed_ids), 1)))
+            for i, (doc_id, content_hash, sections) in enumerate(parsed):
+                __write_document(doc_id, sections, writer)
+                timestamp, percent, est_time = __calculate_progress(i + 1, len(changed_ids), start_time, timestamp)
+                app.populate_content_progress = (percent, est_time)
+        api.upsert_document_hashes({doc_id: hashes[doc_id] for doc_id in changed_ids})
+        app.populate_content_progress = (100, 0)
+
+        # add the frame postings of the re-ingested sentences
+        postings = {}
+        for sentence_id, sentence_pos in api.get_document_sentences(changed_ids):
+            for frame in TextParser.get_frames(sentence_pos, app.frame_dict):
+                postings.setdefault(frame, []).append(sentence_id)
+        api.insert_frame_postings(postings)
+        app.populate_frames_progress = (100, 0)
+
+        # compute the features of new headings, and commit all changes to the production KB at once, along with a new
+        # KB version (so that the other workers reload their indexes)
+        api.set_kb_version()
+        populate_heading_features(app, api)
+    finally:
+        api.conn.close()
+    app.refresh_kb()
+    completion_time = datetime.now()
+    print('Done! (time taken: %s seconds)' % (completion_time - start_time).seconds)
+    return True
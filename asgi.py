@@ -0,0 +1,145 @@
+"""
+asyncio serving mode for the question-answer API (/content and /display/<id>). Questions are answered on one event
+loop, with the KB queried through an asyncpg connection pool and the tagger server through asyncio sockets, so many
+questions can be in flight on a single worker while their I/O is outstanding.
+Indexes, caches and the frame cache are those of the Flask App, which is created (but not run) alongside.
+
+Usage: python asgi.py (or uvicorn asgi:application)
+"""
+import asyncio
+import json
+from types import SimpleNamespace
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import (Response, StreamingResponse)
+from starlette.routing import Route
+from starlette.templating import Jinja2Templates
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+
+import config
+from app import App
+from core.api import (AsyncPostgresAPI, STREAM_FORMATS, accepts_json, accepts_stream)
+from core.parsers import (TextParser, nlp)
+from core.services import StanfordServer
+
+APP = App(__name__)
+ASYNC_POSTGRES_API = AsyncPostgresAPI(database="semantic_kb", min_size=config.asgi['pool_min_size'],
+                                      max_size=config.asgi['pool_max_size'])
+TEMPLATES = Jinja2Templates(directory='templates')
+
+
+def negotiation_request(request: Request) -> SimpleNamespace:
+    # adapt a starlette request to the attributes used by accepts_json and accepts_stream
+    return SimpleNamespace(args=request.query_params,
+                           accept_mimetypes=parse_accept_header(request.headers.get('accept'), MIMEAccept))
+
+
+def render(request: Request, is_json: bool, template: str, **data) -> Response:
+    if is_json:
+        return Response(json.dumps(data), media_type='application/json')
+    return TEMPLATES.TemplateResponse(template, dict(data, request=request))
+
+
+async def startup() -> None:
+    await ASYNC_POSTGRES_API.connect()
+    # share the in-memory indexes of the App (which also updates them whenever they are reloaded)
+    APP.async_postgres_api = ASYNC_POSTGRES_API
+    APP.share_indexes()
+
+
+async def shutdown() -> None:
+    await ASYNC_POSTGRES_API.close()
+    APP.frame_dict.stop()
+
+
+async def check_kb_version() -> None:
+    # another worker may have populated the KB since the indexes were loaded. they are reloaded in a thread, as loading
+    # them blocks
+    version = await ASYNC_POSTGRES_API.get_kb_version()
+    if version != APP.kb_version:
+        await asyncio.get_event_loop().run_in_executor(None, APP.check_kb_version, version)
+
+
+async def content_page(request: Request) -> Response:
+    heading_id = request.path_params['heading_id']
+    is_json = accepts_json(negotiation_request(request))
+    try:
+        await check_kb_version()
+        data = await ASYNC_POSTGRES_API.get_heading_content_by_id(heading_id)
+        if len(data.keys()) > 0:
+            data['content'] = ' '.join([
+                TextParser.extract_sentence(pos_tags, preserve_entities=True)
+                for pos_tags in data['content']
+            ])
+        if is_json:
+            return Response(json.dumps(data), media_type='application/json')
+        else:
+            return TEMPLATES.TemplateResponse('content.html', {'request': request, 'data': data})
+    except Exception as ex:
+        print(ex)
+        return render(request, is_json, 'error.html', data={'error': str(ex)})
+
+
+async def stream_answers(question: str, stream: str) -> next:
+    # serialize each answer as soon as it is produced (see App.stream_answers)
+    def serialize(data: dict, event: str = None) -> str:
+        if stream == 'ndjson':
+            return '%s\n' % json.dumps(data)
+        return '%sdata: %s\n\n' % ('' if event is None else 'event: %s\n' % event, json.dumps(data))
+
+    try:
+        if question is not None:
+            async for heading, url, score, answer in APP.message_engine.process_and_answer_async(
+                    question, ASYNC_POSTGRES_API, stream=True):
+                yield serialize({'heading': heading, 'url': url, 'score': round(score, 2), 'answer': answer})
+        if stream == 'sse':
+            yield serialize({'question': question}, 'done')
+    except IOError as ex:
+        print(ex)
+        yield serialize({'error': str(ex)}, 'error')
+
+
+async def question_answer_page(request: Request) -> Response:
+    negotiation = negotiation_request(request)
+    is_json = accepts_json(negotiation)
+    try:
+        question = request.query_params.get('question')
+        await check_kb_version()
+        # stream each answer as soon as it is produced if requested
+        stream = accepts_stream(negotiation)
+        if stream is not None:
+            return StreamingResponse(stream_answers(question, stream), media_type=STREAM_FORMATS[stream],
+                                     headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+        answers = [
+            {'heading': heading, 'url': url, 'score': round(score, 2), 'answer': answer}
+            async for heading, url, score, answer in APP.message_engine.process_and_answer_async(
+                question, ASYNC_POSTGRES_API)
+        ] if question is not None else []
+
+        # output the answers
+        return render(request, is_json, 'answers.html', question=question, answers=answers)
+    except IOError as ex:
+        print(ex)
+        return render(request, is_json, 'error.html', data={'error': str(ex)})
+
+
+application = Starlette(routes=[
+    Route('/content', question_answer_page, methods=['GET']),
+    Route('/display/{heading_id:int}', content_page, methods=['GET']),
+], on_startup=[startup], on_shutdown=[shutdown])
+
+
+def start():
+    # the stanford server is only needed if the pos-tagger backend talks to it
+    if nlp.get_pos_tagger().requires_server:
+        with StanfordServer():
+            uvicorn.run(application, host=config.asgi['host'], port=config.asgi['port'])
+    else:
+        uvicorn.run(application, host=config.asgi['host'], port=config.asgi['port'])
+
+
+if __name__ == "__main__":
+    start()
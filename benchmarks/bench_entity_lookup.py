@@ -0,0 +1,73 @@
+"""
+Benchmark per-question entity lookup latency of the sequential-scan and trigram-indexed fuzzy match modes (one query per
+string), and of the batched lookup (one query per question), against the number of entities in the KB.
+**Drops and recreates the maintenance schema**, so do not run it while the KB is being populated.
+
+Usage: python -m benchmarks.bench_entity_lookup [kb_size ...]
+"""
+import random
+import string
+import sys
+from datetime import datetime
+
+from core.api import PostgresAPI
+from core.api.postgres_api import (FUZZY_MATCH_INDEXED, FUZZY_MATCH_SCAN, copy_rows)
+from core.parsers import nlp
+
+KB_SIZES = [1000, 10000, 50000, 100000]
+QUESTION_COUNT = 50
+ENTITIES_PER_QUESTION = 3
+
+
+def generate_entities(count: int, rnd: random.Random) -> list:
+    def word() -> str:
+        return ''.join(rnd.choice(string.ascii_lowercase) for _ in range(rnd.randint(3, 10)))
+
+    return sorted(set(' '.join(word() for _ in range(rnd.randint(1, 3))) for _ in range(count)))
+
+
+def generate_questions(entities: list, rnd: random.Random) -> list:
+    # each question has a few entities. some are exact KB entities, some have typos, and some are unseen
+    def mutate(entity: str) -> str:
+        i = rnd.randrange(len(entity))
+        return entity[:i] + rnd.choice(string.ascii_lowercase) + entity[i + 1:]
+
+    questions = []
+    for _ in range(QUESTION_COUNT):
+        q_entities = [rnd.choice([lambda e: e, mutate])(rnd.choice(entities)) for _ in range(ENTITIES_PER_QUESTION)]
+        questions += [[text for entity in q_entities
+                       for text in [entity] + [gram for grams in nlp.get_ngrams(entity) for gram in grams]]]
+    return questions
+
+
+def time_questions(api: PostgresAPI, questions: list, batched: bool) -> float:
+    start_time = datetime.now()
+    for question in questions:
+        if batched:
+            api.match_entities(question)
+        else:
+            for text in question:
+                api.match_entity(text)
+    return (datetime.now() - start_time).total_seconds() * 1000 / len(questions)
+
+
+def main(kb_sizes: list):
+    rnd = random.Random(0)
+    api = PostgresAPI(maintenance=True)
+    print('%10s %16s %16s %16s' % ('entities', 'scan (ms/q)', 'indexed (ms/q)', 'batched (ms/q)'))
+    for kb_size in kb_sizes:
+        api.initialize_db()
+        entities = generate_entities(kb_size, rnd)
+        copy_rows(api.cursor, 'entities', ['entity'], [(entity,) for entity in entities])
+        api.cursor.execute('ANALYZE entities')
+        questions = generate_questions(entities, rnd)
+        latencies = []
+        for mode, batched in ((FUZZY_MATCH_SCAN, False), (FUZZY_MATCH_INDEXED, False), (FUZZY_MATCH_INDEXED, True)):
+            api.fuzzy_match = mode
+            latencies += [time_questions(api, questions, batched)]
+        print('%10d %16.2f %16.2f %16.2f' % (len(entities), latencies[0], latencies[1], latencies[2]))
+    api.initialize_db()
+
+
+if __name__ == "__main__":
+    main([int(x) for x in sys.argv[1:]] if len(sys.argv) > 1 else KB_SIZES)
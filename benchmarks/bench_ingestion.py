@@ -0,0 +1,62 @@
+"""
+Benchmark sentence ingestion throughput of PostgresAPI.insert_sentence (one row at a time) against BulkWriter (COPY).
+**Drops and recreates the maintenance schema**, so do not run it while the KB is being populated.
+
+Usage: python -m benchmarks.bench_ingestion [sentence_count] [entities_per_sentence]
+"""
+import random
+import string
+import sys
+from datetime import datetime
+
+from core.api import PostgresAPI
+
+HEADINGS_PER_PAGE = 5
+SENTENCES_PER_HEADING = 20
+VOCABULARY_SIZE = 5000
+
+
+def generate_rows(count: int, entities_per_sentence: int) -> list:
+    rnd = random.Random(0)
+    vocabulary = [''.join(rnd.choice(string.ascii_lowercase) for _ in range(rnd.randint(4, 12)))
+                  for _ in range(VOCABULARY_SIZE)]
+    rows = []
+    for i in range(count):
+        headings = ['product', 'page %d' % (i // (HEADINGS_PER_PAGE * SENTENCES_PER_HEADING)),
+                    'section %d' % (i // SENTENCES_PER_HEADING)]
+        sentence = ' '.join('%s__NN' % rnd.choice(vocabulary) for _ in range(12))
+        entities = set(rnd.choice(vocabulary) for _ in range(entities_per_sentence))
+        rows += [(headings, sentence, entities)]
+    return rows
+
+
+def run_row_by_row(api: PostgresAPI, rows: list) -> float:
+    api.initialize_db()
+    start_time = datetime.now()
+    for headings, sentence, entities in rows:
+        api.insert_sentence(sentence, entities, [], api.insert_headings(headings))
+    api.conn.commit()
+    return (datetime.now() - start_time).total_seconds()
+
+
+def run_bulk(api: PostgresAPI, rows: list) -> float:
+    api.initialize_db()
+    start_time = datetime.now()
+    with api.bulk_writer() as writer:
+        for headings, sentence, entities in rows:
+            writer.add_sentence(sentence, entities, [], writer.insert_headings(headings))
+    api.conn.commit()
+    return (datetime.now() - start_time).total_seconds()
+
+
+def main(count: int, entities_per_sentence: int):
+    rows = generate_rows(count, entities_per_sentence)
+    api = PostgresAPI(maintenance=True)
+    for name, runner in (('insert_sentence', run_row_by_row), ('bulk_writer', run_bulk)):
+        seconds = runner(api, rows)
+        print('\n%-16s %8d sentences in %8.2f s -> %10.1f sentences/s' % (name, count, seconds, count / seconds))
+    api.initialize_db()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000, int(sys.argv[2]) if len(sys.argv) > 2 else 4)
@@ -0,0 +1,66 @@
+"""
+Benchmark the per-token cost of text normalization and lemmatization, before (uncached, with a new lemmatizer per
+call) and after memoization (with a cold cache, and with a warm cache, as when the same vocabulary repeats during a
+populate run or across questions). Tokens are drawn from the WordNet vocabulary with a Zipf distribution.
+
+Usage: python -m benchmarks.bench_normalize [token_count]
+"""
+import random
+import sys
+from datetime import datetime
+
+from nltk.corpus import wordnet
+from nltk.stem import WordNetLemmatizer
+
+from core.parsers import nlp
+
+TOKEN_COUNT = 20000
+VOCABULARY_SIZE = 5000
+
+
+def generate_tokens(count: int, rnd: random.Random) -> list:
+    vocabulary = [word.replace('_', ' ') for word, _ in zip(wordnet.all_lemma_names(), range(VOCABULARY_SIZE))]
+    rnd.shuffle(vocabulary)
+    return rnd.choices(vocabulary, weights=[1 / (i + 1) for i in range(len(vocabulary))], k=count)
+
+
+def normalize_tokens(tokens: list) -> None:
+    # the calls made per token by extract_entities and get_frames
+    for token in tokens:
+        nlp.normalize_text(token)
+        nlp.normalize_text(token, lemmatize=False, ignore_num=True)
+        nlp.lemmatize_word(token, wordnet.VERB)
+
+
+def time_tokens(tokens: list) -> float:
+    start_time = datetime.now()
+    normalize_tokens(tokens)
+    return (datetime.now() - start_time).total_seconds() * 1000000 / len(tokens)
+
+
+def main(token_count: int):
+    tokens = generate_tokens(token_count, random.Random(0))
+    # load wordnet before timing
+    nlp.lemmatize_word.__wrapped__('warmup')
+    normalize_text, lemmatize_word = nlp.normalize_text, nlp.lemmatize_word
+
+    # before: no caching, and a new lemmatizer per call
+    nlp.normalize_text = normalize_text.__wrapped__
+    nlp.lemmatize_word = lambda word, pos=wordnet.NOUN: WordNetLemmatizer().lemmatize(word, pos)
+    uncached = time_tokens(tokens)
+    nlp.normalize_text, nlp.lemmatize_word = normalize_text, lemmatize_word
+
+    # after: memoized, starting from an empty cache, and again with the cache filled
+    normalize_text.cache_clear()
+    lemmatize_word.cache_clear()
+    cold = time_tokens(tokens)
+    warm = time_tokens(tokens)
+
+    print('%d tokens (%d distinct)' % (len(tokens), len(set(tokens))))
+    print('%12s %12s %12s' % ('uncached', 'cold cache', 'warm cache'))
+    print('%9.2f us %9.2f us %9.2f us   (per token)' % (uncached, cold, warm))
+    print(normalize_text.cache_info())
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else TOKEN_COUNT)
@@ -0,0 +1,105 @@
+"""
+Load test of the production server (see gunicorn.conf.py). For each worker count, starts the server, sends questions
+to /content from concurrent clients for a fixed duration, and reports requests/sec and latency percentiles.
+With --url, an already running server is tested instead (the worker counts are then only used as labels).
+Questions are repeated, so set config.answer_cache['max_size'] to 0 to measure answering rather than the cache.
+
+Usage: python -m benchmarks.load_test [--url URL] [--clients N] [--duration SECONDS] [worker_count ...]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+from urllib.request import (Request, urlopen)
+
+WORKER_COUNTS = sorted(set([1, 2, 4, os.cpu_count() or 1]))
+CLIENT_COUNT = 16
+DURATION = 30
+STARTUP_TIMEOUT = 300
+QUESTIONS = [
+    'How do I configure a datasource?',
+    'What is the default port of the management console?',
+    'How to enable debug logs?',
+    'How do I add a user store?',
+    'What databases are supported?',
+    'How to change the admin password?',
+]
+
+
+def wait_until_ready(url: str, process: subprocess.Popen) -> None:
+    deadline = time.time() + STARTUP_TIMEOUT
+    while time.time() < deadline:
+        if process is not None and process.poll() is not None:
+            raise IOError('Server exited with code %d' % process.returncode)
+        try:
+            urlopen(url + '/', timeout=5).read()
+            return
+        except OSError:
+            time.sleep(1)
+    raise IOError('Server did not start within %d seconds' % STARTUP_TIMEOUT)
+
+
+def run_client(url: str, index: int, deadline: float) -> list:
+    # send questions one after the other until the deadline, and return the latency of each successful request
+    latencies = []
+    i = index
+    while time.time() < deadline:
+        request = Request('%s/content?%s' % (url, urlencode({'question': QUESTIONS[i % len(QUESTIONS)]})),
+                          headers={'Accept': 'application/json'})
+        start_time = time.time()
+        try:
+            urlopen(request, timeout=60).read()
+            latencies.append(time.time() - start_time)
+        except OSError as ex:
+            print(ex)
+        i += 1
+    return latencies
+
+
+def run_load(url: str, clients: int, duration: float) -> tuple:
+    deadline = time.time() + duration
+    start_time = time.time()
+    with ThreadPoolExecutor(clients) as executor:
+        results = list(executor.map(lambda i: run_client(url, i, deadline), range(clients)))
+    elapsed = time.time() - start_time
+    latencies = sorted(latency for result in results for latency in result)
+    if len(latencies) == 0:
+        return 0, 0, 0
+    return (len(latencies) / elapsed, latencies[len(latencies) // 2] * 1000,
+            latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)] * 1000)
+
+
+def main(worker_counts: list, url: str, clients: int, duration: float):
+    print('%8s %12s %12s %12s' % ('workers', 'req/s', 'p50 (ms)', 'p95 (ms)'))
+    for worker_count in worker_counts:
+        process = None
+        server_url = url
+        if server_url is None:
+            port = 5100
+            server_url = 'http://127.0.0.1:%d' % port
+            process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--workers',
+                                        str(worker_count), '--bind', '127.0.0.1:%d' % port, 'wsgi:application'],
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_until_ready(server_url, process)
+            # warm up every worker (frame lookups, connections) before measuring
+            run_load(server_url, clients, min(duration, 5))
+            rate, p50, p95 = run_load(server_url, clients, duration)
+            print('%8d %12.1f %12.1f %12.1f' % (worker_count, rate, p50, p95))
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Load test the production server')
+    parser.add_argument('worker_counts', type=int, nargs='*', default=WORKER_COUNTS)
+    parser.add_argument('--url', default=None, help='url of a running server (default: start one per worker count)')
+    parser.add_argument('--clients', type=int, default=CLIENT_COUNT)
+    parser.add_argument('--duration', type=float, default=DURATION)
+    args = parser.parse_args()
+    main(args.worker_counts, args.url, args.clients, args.duration)
@@ -5,6 +5,59 @@ wikifier = {
     'user_name': 'wso2',
     'user_key': 'shehuqxlrvxugyclvfxsvqusmjkagp'
 }
+# POS Tagger Configurations ('stanford' uses the java tagger server, 'perceptron' tags in-process using NLTK)
+tagger = {
+    'backend': 'stanford'
+}
+# Ingestion Configurations (number of processes used to parse documents when populating the KB. 1 = no parallelism.
+# populate runs commit, and record a checkpoint to resume from, every checkpoint_documents / checkpoint_sentences)
+ingestion = {
+    'workers': os.cpu_count() or 1,
+    'chunk_size': 4,
+    # chunks per worker read from MongoDB ahead of the writer, which bounds the documents held in memory
+    'window_chunks': 8,
+    'checkpoint_documents': 200,
+    'checkpoint_sentences': 50000
+}
+# In-memory Index Configurations (loaded at startup, and reloaded after the KB is populated)
+indexes = {
+    'entities': True,
+    'postings': True,
+    'heading_features': True
+}
+# Answer Cache Configurations (max_size = 0 disables the cache. ttl is in seconds)
+answer_cache = {
+    'max_size': 1024,
+    'ttl': 3600
+}
+# Frame Cache Configurations (at most max_size keys are kept in memory. new keys are written to MongoDB once no key
+# was added for flush_delay seconds, or at most max_flush_delay seconds after they were added)
+frame_cache = {
+    'max_size': 100000,
+    'flush_delay': 5,
+    'max_flush_delay': 60
+}
+# Postgres Connection Pool Configurations of the web tier (each request checks out its own connection)
+postgres_pool = {
+    'min_size': 1,
+    'max_size': 10
+}
+# Production Server Configurations (see gunicorn.conf.py. workers are pre-forked, tagger servers are shared by them)
+production = {
+    'host': '0.0.0.0',
+    'port': 5000,
+    'workers': os.cpu_count() or 1,
+    'threads': 4,
+    'tagger_servers': 2,
+    'tagger_base_port': 6000
+}
+# asyncio Serving Configurations (see asgi.py. pool sizes are of the asyncpg connection pool)
+asgi = {
+    'host': '0.0.0.0',
+    'port': 8000,
+    'pool_min_size': 2,
+    'pool_max_size': 10
+}
 # Saml Configurations
 saml = {
     'secret_key': 'secret',
@@ -18,6 +71,7 @@ def get_nltk_dependencies():
     nltk.download('stopwords', download_dir=nltk_data_dir)
     nltk.download('framenet_v17', download_dir=nltk_data_dir)
     nltk.download('wordnet', download_dir=nltk_data_dir)
+    nltk.download('averaged_perceptron_tagger', download_dir=nltk_data_dir)
 
 
 if __name__ == "__main__":
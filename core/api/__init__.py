@@ -1,6 +1,8 @@
-from core.api.common import accepts_json
+from core.api.common import (STREAM_FORMATS, accepts_json, accepts_stream)
+from core.api.async_postgres_api import AsyncPostgresAPI
 from core.api.conceptnet_api import ConceptNetAPI
+from core.api.frame_store import FrameStore
 from core.api.mongo_api import MongoAPI
-from core.api.postgres_api import PostgresAPI
-from core.api.stanford_api import StanfordAPI
+from core.api.postgres_api import (BulkWriter, PostgresAPI)
+from core.api.stanford_api import (AsyncStanfordAPI, StanfordAPI)
 from core.api.wikifier_api import WikifierAPI
@@ -0,0 +1,170 @@
+import asyncpg
+
+from core.api.postgres_api import (ENTITY_MATCH_QUERIES, FUZZY_MATCH_INDEXED, FUZZY_MATCH_SCAN, MIN_RESULT_COUNT,
+                                   SPLIT_CHAR, TRGM_SIMILARITY_THRESHOLD, frame_match_query, get_matching_entity_ids,
+                                   heading_match_query)
+
+
+class AsyncPostgresAPI:
+    """
+asyncio counterpart of the read queries of PostgresAPI used for answering questions, over an asyncpg connection
+pool. Each query checks out its own connection, so many questions can be answered concurrently on one event loop.
+The optional in-memory indexes are shared with the PostgresAPI they were loaded for
+    """
+
+    def __init__(self, user="semantic_kb", password="semantic_kb", database="semantic_kb", min_size: int = 2,
+                 max_size: int = 10, fuzzy_match=FUZZY_MATCH_INDEXED) -> None:
+        super().__init__()
+        self.user = user
+        self.password = password
+        self.database = database
+        self.min_size = min_size
+        self.max_size = max_size
+        self.fuzzy_match = fuzzy_match
+        # fuzzy match mode the KB supports (see update_match_mode), resolved on first use
+        self.match_mode = None
+        self.schema_name = "semantic_kb"
+        self.entity_index = None
+        self.postings_index = None
+        self.pool = None
+
+    async def connect(self) -> None:
+        """
+    Open the connection pool. Must be awaited from the event loop that runs the queries
+        """
+        # the search path and trigram threshold are connection parameters: the pool resets (RESET ALL) settings made
+        # with SET whenever a connection is released
+        settings = {'search_path': self.schema_name, 'pg_trgm.similarity_threshold': str(TRGM_SIMILARITY_THRESHOLD)}
+        self.pool = await asyncpg.create_pool(user=self.user, password=self.password, database=self.database,
+                                              min_size=self.min_size, max_size=self.max_size,
+                                              server_settings=settings)
+
+    async def close(self) -> None:
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    async def get_kb_version(self) -> str:
+        # see PostgresAPI.get_kb_version
+        if not await self.pool.fetchval("SELECT to_regclass('kb_version') IS NOT NULL"):
+            return None
+        return await self.pool.fetchval('SELECT version FROM kb_version')
+
+    async def update_match_mode(self) -> str:
+        # see PostgresAPI.update_match_mode
+        self.match_mode = self.fuzzy_match
+        if self.fuzzy_match == FUZZY_MATCH_INDEXED and \
+                not await self.pool.fetchval("SELECT to_regclass('entities_entity_trgm_idx') IS NOT NULL"):
+            self.match_mode = FUZZY_MATCH_SCAN
+        return self.match_mode
+
+    async def match_entities(self, texts: list) -> dict:
+        """
+    Fuzzy-match many strings against the KB entities in a single query (see PostgresAPI.match_entities)
+        :param texts: normalized entities and/or n-grams
+        :return: dict of string -> list of matching entity ids
+        """
+        texts = sorted(set(texts))
+        if len(texts) == 0:
+            return {}
+        if self.entity_index is not None:
+            return {text: self.entity_index.match(text) for text in texts}
+        match_mode = self.match_mode if self.match_mode is not None else await self.update_match_mode()
+        rows = await self.pool.fetch('''
+            SELECT Q.text, M.entity_id
+            FROM unnest($1::TEXT[]) AS Q(text)
+            CROSS JOIN LATERAL ({0}) AS M
+            ORDER BY Q.text, M.entity_length ASC, M.edit_distance ASC
+        '''.format(ENTITY_MATCH_QUERIES[match_mode]), texts)
+        matches = {text: [] for text in texts}
+        for text, entity_id in rows:
+            matches[text] += [int(entity_id)]
+        return matches
+
+    async def query_sentence_ids(self, entities: dict, frames: set) -> dict:
+        """
+    Get the sentence ids matching the question entities and frames, grouped under headings (see
+    PostgresAPI.query_sentence_ids). Entities and n-grams are always looked up in one batch
+        :param entities: Dictionary containing the entity as key, and possible ngrams as the value
+        :param frames: Set of question frames
+        :return: dict of heading id -> sentence ids
+        """
+        n = max(len(x.split()) for x in entities)
+        candidates = list(entities) + [ngram for entity in entities for grams in entities[entity] for ngram in grams]
+        lookup = await self.match_entities(candidates)
+
+        # Get the sentence ids of the sentences containing the passed entity ids
+        async def get_entity_matching_sent_ids(input_entities: dict) -> dict:
+            non_empty_entities = sorted(set(entity for entity in input_entities if len(input_entities[entity]) > 0))
+            if len(non_empty_entities) == 0:
+                return {}
+            if self.postings_index is not None:
+                return self.postings_index.match_headings([input_entities[entity] for entity in non_empty_entities])
+            rows = await self.pool.fetch(heading_match_query(input_entities, non_empty_entities))
+            return {heading: sentence_ids for heading, sentence_ids in rows}
+
+        # Step down ngram size until at least one heading group returned
+        h_grp_match_dict = {}
+        for i in range(n, 0, -1):
+            entity_ids_dict = get_matching_entity_ids(entities, i, lookup.__getitem__)
+            h_grp_match_dict = await get_entity_matching_sent_ids(entity_ids_dict)
+            if len(h_grp_match_dict) >= MIN_RESULT_COUNT:
+                break
+
+        if len(frames) == 0:
+            return h_grp_match_dict
+        # Filter out results that does not contain any input frames
+        fil_h_grp_match_dict = {}
+        for heading in h_grp_match_dict:
+            if len(h_grp_match_dict[heading]) > 0 and \
+                    await self.pool.fetchval(frame_match_query(set(h_grp_match_dict[heading]), frames)):
+                fil_h_grp_match_dict[heading] = h_grp_match_dict[heading]
+        return fil_h_grp_match_dict
+
+    async def get_heading_info_by_ids(self, heading_ids: list) -> dict:
+        if heading_ids is None or len(heading_ids) == 0:
+            return {}
+        rows = await self.pool.fetch('''
+          SELECT
+            H.heading_id,
+            H.heading,
+            MIN(sentence_id) first_sentence_id,
+            MAX(sentence_id) last_sentence_id
+          FROM headings as H
+          NATURAL JOIN sentences as S
+          WHERE heading_id = ANY($1::INTEGER[])
+          GROUP BY heading_id
+        ''', sorted(int(x) for x in heading_ids))
+        return {heading_id: (heading, min_id, max_id) for heading_id, heading, min_id, max_id in rows}
+
+    async def get_sentences_by_ids(self, sentence_ids: list) -> dict:
+        """
+    Fetch many sentences in one query (see PostgresAPI.get_sentences_by_ids)
+        :param sentence_ids: list of sentence ids
+        :return: dict of sentence_id -> list of pos tags, ordered by sentence id. missing ids are left out
+        """
+        sentence_ids = sorted(set(int(x) for x in sentence_ids))
+        if len(sentence_ids) == 0:
+            return {}
+        rows = await self.pool.fetch('''
+          SELECT sentence_id, sentence FROM sentences
+          WHERE sentence_id = ANY($1::INTEGER[])
+          ORDER BY sentence_id ASC
+        ''', sentence_ids)
+        return {
+            row[0]: [tuple(str.rsplit(tag, SPLIT_CHAR, 1)) for tag in row[1].split()] for row in rows
+        }
+
+    async def get_heading_content_by_id(self, heading_id: int) -> dict:
+        row = await self.pool.fetchrow('''
+          SELECT heading_id, heading, content FROM heading_content
+          WHERE heading_id = $1
+        ''', heading_id)
+        if row is None:
+            return {}
+        else:
+            return {
+                'heading_id': row[0],
+                'heading': row[1],
+                'content': ((tuple(str.rsplit(tag, SPLIT_CHAR, 1)) for tag in sent.split()) for sent in row[2])
+            }
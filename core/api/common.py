@@ -1,5 +1,11 @@
 from flask import Request
 
+# streaming formats of answers, and their mimetypes
+STREAM_FORMATS = {
+    'sse': 'text/event-stream',
+    'ndjson': 'application/x-ndjson'
+}
+
 
 def accepts_json(request: Request) -> bool:
     """
@@ -8,3 +14,21 @@ Returns whether a HTTP request accepts a JSON or HTML as output
     :return: true requests accepts JSON. false if accepts HTML)
     """
     return request.accept_mimetypes.best_match(['application/json', 'text/html']) == 'application/json'
+
+
+def accepts_stream(request: Request) -> str:
+    """
+Returns the streaming format requested by a HTTP request, either through the "stream" query parameter, or through
+the Accept header
+    :param request: HTTP request object
+    :return: 'sse' for server-sent events, 'ndjson' for newline-delimited JSON, or None if not streamed
+    """
+    stream = request.args.get('stream')
+    if stream in STREAM_FORMATS:
+        return stream
+    # non-streamed responses come first, so that wildcard Accept headers are not streamed
+    best_match = request.accept_mimetypes.best_match(['application/json', 'text/html'] + list(STREAM_FORMATS.values()))
+    for stream, mimetype in STREAM_FORMATS.items():
+        if best_match == mimetype:
+            return stream
+    return None
@@ -0,0 +1,119 @@
+from threading import (Condition, Thread)
+from time import monotonic
+
+FLUSH_DELAY = 5
+MAX_FLUSH_DELAY = 60
+
+
+class FrameStore:
+    """
+Frames of word__pos keys persisted in MongoDB, one document per key. Keys are looked up in MongoDB one at a time, and
+keys added since the last flush are upserted in bulk by a background flusher, once no key was added for flush_delay
+seconds (or max_flush_delay seconds after the oldest unflushed key was added). Only unflushed keys are kept in memory
+(see core.engine.FrameCache for a bounded in-memory cache in front of the store)
+    """
+
+    def __init__(self, mongo_api: 'MongoAPI', collection_name: str, flush_delay: float = FLUSH_DELAY,
+                 max_flush_delay: float = MAX_FLUSH_DELAY) -> None:
+        """
+        :param mongo_api: MongoAPI the keys are loaded from and written to
+        :param collection_name: name of the collection of the keys
+        :param flush_delay: seconds without new keys after which new keys are flushed
+        :param max_flush_delay: maximum seconds a new key waits to be flushed
+        """
+        super().__init__()
+        self.mongo_api = mongo_api
+        self.collection_name = collection_name
+        self.flush_delay = flush_delay
+        self.max_flush_delay = max_flush_delay
+        # keys added since the last flush, and keys being flushed
+        self.pending = {}
+        self.flushing = {}
+        # time the oldest and the newest unflushed keys were added
+        self.first_dirty = None
+        self.last_dirty = None
+        self.condition = Condition()
+        self.flusher = None
+        self.stopped = False
+
+    def put(self, key: str, value: list) -> None:
+        with self.condition:
+            self.pending[key] = value
+            self.last_dirty = monotonic()
+            if self.first_dirty is None:
+                self.first_dirty = self.last_dirty
+            # the flusher is started on first use (and again in forked processes, which do not inherit it)
+            if self.flusher is None or not self.flusher.is_alive():
+                self.flusher = Thread(target=self.__run_flusher, daemon=True)
+                self.flusher.start()
+            self.condition.notify_all()
+
+    def get(self, key: str, default: list = None) -> list:
+        with self.condition:
+            if key in self.pending:
+                return self.pending[key]
+            if key in self.flushing:
+                return self.flushing[key]
+        # look up other keys in MongoDB (outside the lock, so that other lookups are not blocked meanwhile)
+        return self.mongo_api.get_frames(self.collection_name, [key]).get(key, default)
+
+    def flush(self) -> int:
+        """
+    Upsert the keys added since the last flush
+        :return: number of keys written
+        """
+        with self.condition:
+            entries = self.pending
+            self.flushing.update(entries)
+            self.pending = {}
+            self.first_dirty = self.last_dirty = None
+        try:
+            self.mongo_api.upsert_frames(self.collection_name, entries)
+        except Exception:
+            # keep the keys as unflushed (unless added again meanwhile), so that they are written again after
+            # flush_delay seconds
+            with self.condition:
+                for key, value in entries.items():
+                    self.pending.setdefault(key, value)
+                self.first_dirty = self.last_dirty = monotonic()
+            raise
+        finally:
+            with self.condition:
+                for key in entries:
+                    self.flushing.pop(key, None)
+        return len(entries)
+
+    def stop(self) -> None:
+        """
+    Stop the background flusher, and flush the keys added since the last flush. Adding a key starts the flusher again
+        """
+        with self.condition:
+            flusher = self.flusher
+            self.stopped = True
+            self.condition.notify_all()
+        if flusher is not None:
+            flusher.join()
+        with self.condition:
+            if self.flusher is flusher:
+                self.flusher = None
+            self.stopped = False
+        self.flush()
+
+    def __run_flusher(self) -> None:
+        while True:
+            with self.condition:
+                while not self.stopped and len(self.pending) == 0:
+                    self.condition.wait()
+                # wait until no key was added for flush_delay seconds, or the oldest key waited max_flush_delay seconds
+                while not self.stopped and len(self.pending) > 0:
+                    remaining = min(self.last_dirty + self.flush_delay,
+                                    self.first_dirty + self.max_flush_delay) - monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+                if self.stopped:
+                    return
+            try:
+                self.flush()
+            except Exception as ex:
+                print(ex)
@@ -1,4 +1,6 @@
-from pymongo import MongoClient
+from pymongo import (MongoClient, UpdateOne)
+
+from core.api.frame_store import (FLUSH_DELAY, MAX_FLUSH_DELAY, FrameStore)
 
 
 class MongoAPI:
@@ -15,22 +17,52 @@ class MongoAPI:
         super().__init__()
         self.mongo_uri = mongo_uri
         self.mongo_db = mongo_db
+        self.connect()
+
+    def connect(self) -> None:
+        # MongoClient is not fork-safe, so forked processes must call this to open their own client
         self.client = MongoClient(self.mongo_uri)
         self.db = self.client[self.mongo_db]
 
+    def close(self) -> None:
+        self.client.close()
+
     def get_all_documents(self, collection_name: str) -> next:
         return self.db[collection_name].find().batch_size(10)
 
-    def get_document_count(self, collection_name: str) -> int:
-        return self.db[collection_name].count()
+    def get_documents_by_ids(self, collection_name: str, ids: list) -> next:
+        return self.db[collection_name].find({'_id': {'$in': list(ids)}}).batch_size(10)
+
+    def get_documents_after(self, collection_name: str, last_id=None) -> next:
+        # documents in _id order, starting after the given _id (if any), so that an interrupted pass can be resumed
+        query = {} if last_id is None else {'_id': {'$gt': last_id}}
+        return self.db[collection_name].find(query).sort('_id', 1).batch_size(10)
+
+    def get_document_count(self, collection_name: str, query: dict = None) -> int:
+        return self.db[collection_name].count(query)
 
     def insert_document(self, collection_name: str, document: dict):
         self.db[collection_name].insert_one(document)
 
-    def load_frame_cache(self, collection_name: str):
-        result = self.db[collection_name].find_one()
-        return dict(result) if result is not None else dict()
+    def load_frame_cache(self, collection_name: str, flush_delay: float = FLUSH_DELAY,
+                         max_flush_delay: float = MAX_FLUSH_DELAY) -> FrameStore:
+        """
+    Open the frame cache of a collection. Keys are loaded lazily (see FrameStore). A frame cache persisted as a
+    single document (the format used before keys were stored one per document) is migrated first
+        """
+        legacy = self.db[collection_name].find_one({'frames': {'$exists': False}})
+        if legacy is not None:
+            self.upsert_frames(collection_name, {key: value for key, value in legacy.items() if key != '_id'})
+            self.db[collection_name].delete_one({'_id': legacy['_id']})
+        return FrameStore(self, collection_name, flush_delay, max_flush_delay)
+
+    def get_frames(self, collection_name: str, keys: list) -> dict:
+        return {doc['_id']: doc['frames'] for doc in self.db[collection_name].find({'_id': {'$in': list(keys)}})}
 
-    def persist_frame_cache(self, collection_name: str, frame_cache: dict):
-        self.db[collection_name].drop()
-        self.db[collection_name].insert_one(frame_cache)
+    def upsert_frames(self, collection_name: str, frames: dict) -> None:
+        # one upsert per key, sent in bulk
+        if len(frames) == 0:
+            return
+        self.db[collection_name].bulk_write([
+            UpdateOne({'_id': key}, {'$set': {'frames': value}}, upsert=True) for key, value in frames.items()
+        ], ordered=False)
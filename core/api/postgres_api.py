@@ -1,10 +1,24 @@
+from io import BytesIO
+from threading import (Condition, local)
+from time import monotonic
+from uuid import uuid4
+
 import pg8000 as psql
 
+BULK_BATCH_SIZE = 5000
 ERROR_TOLERANCE = 5
+FUZZY_MATCH_INDEXED = 'indexed'
+FUZZY_MATCH_SCAN = 'scan'
 MAX_ENTITY_LENGTH = 50
 ROOT_NODE_NAME = 'ROOT'
 SPLIT_CHAR = '__'
 MIN_RESULT_COUNT = 3
+POOL_HEALTH_CHECK_INTERVAL = 30
+POOL_MAX_SIZE = 10
+POOL_MIN_SIZE = 1
+POOL_TIMEOUT = 30
+TRGM_CANDIDATE_LIMIT = 50
+TRGM_SIMILARITY_THRESHOLD = 0.3
 
 
 def str_conv(iterable: list, start: str = '{', end: str = '}') -> str:
@@ -12,20 +26,433 @@ def str_conv(iterable: list, start: str = '{', end: str = '}') -> str:
     return result
 
 
+def array_literal(values: list) -> str:
+    # text[] literal with every element quoted, so that elements may contain commas, quotes or braces
+    return '{%s}' % ','.join('"%s"' % str(value).replace('\\', '\\\\').replace('"', '\\"') for value in values)
+
+
+def copy_escape(value) -> str:
+    # escape a value for the text format of COPY
+    if value is None:
+        return '\\N'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def copy_rows(cursor, table: str, columns: list, rows: list) -> None:
+    """
+Load rows into a table with a single COPY ... FROM STDIN
+    :param cursor: database cursor
+    :param table: name of the table
+    :param columns: column names, in the order of the values in each row
+    :param rows: list of row tuples
+    """
+    data = ''.join('%s\n' % '\t'.join(copy_escape(value) for value in row) for row in rows)
+    cursor.execute('COPY {0} ({1}) FROM STDIN'.format(table, ', '.join(columns)), stream=BytesIO(data.encode('utf-8')))
+
+
+class BulkWriter:
+    """
+Stage sentences, entities and normalizations in memory, and flush them to the KB in batches. Each flush COPYs the
+staged rows into temp tables and resolves the ids with set-based INSERT ... ON CONFLICT ... RETURNING statements
+    """
+
+    def __init__(self, api: 'PostgresAPI', batch_size: int = BULK_BATCH_SIZE) -> None:
+        super().__init__()
+        self.api = api
+        self.batch_size = batch_size
+        self.sentences = []
+        self.normalizations = []
+        self.heading_ids = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if type is None:
+            self.flush()
+
+    def insert_headings(self, headings: list) -> int:
+        # heading ids do not change during a populate run, so each heading path is only written once
+        key = tuple(headings)
+        if key not in self.heading_ids:
+            self.heading_ids[key] = self.api.insert_headings(headings)
+        return self.heading_ids[key]
+
+    def add_sentence(self, sentence: str, entities: set, dependencies: set, heading_id: int = None,
+                     doc_id: str = None) -> None:
+        order = len(self.sentences)
+        self.sentences += [(order, sentence, str_conv(list(dependencies)), heading_id if heading_id else 1, doc_id)]
+        self.normalizations += [(order, entity) for entity in entities]
+        if len(self.sentences) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> int:
+        """
+    Write all staged sentences and their entities to the KB, in the order they were added
+        :return: number of sentences written
+        """
+        count = len(self.sentences)
+        if count == 0:
+            return 0
+        cursor = self.api.cursor
+        cursor.execute('''
+            CREATE TEMP TABLE IF NOT EXISTS staged_sentences (
+              ord INTEGER,
+              sentence TEXT,
+              dependencies TEXT[],
+              heading_id INTEGER,
+              doc_id TEXT
+            )''')
+        cursor.execute('''
+            CREATE TEMP TABLE IF NOT EXISTS staged_normalizations (
+              ord INTEGER,
+              entity TEXT
+            )''')
+        cursor.execute('''TRUNCATE staged_sentences, staged_normalizations''')
+        copy_rows(cursor, 'staged_sentences', ['ord', 'sentence', 'dependencies', 'heading_id', 'doc_id'],
+                  self.sentences)
+        copy_rows(cursor, 'staged_normalizations', ['ord', 'entity'], self.normalizations)
+
+        # Insert new entities
+        cursor.execute('''
+            INSERT INTO entities (entity)
+            SELECT DISTINCT entity FROM staged_normalizations ORDER BY entity
+            ON CONFLICT (entity) DO NOTHING
+        ''')
+
+        # Insert sentences in staging order (so that sentence ids stay adjacent), and map them to their documents and
+        # entities. sentences that already existed (e.g. shared by another document) keep their normalizations
+        cursor.execute('''
+            WITH inserted AS (
+              INSERT INTO sentences (sentence, dependencies, heading_id)
+              SELECT sentence, dependencies, heading_id FROM (
+                SELECT DISTINCT ON (sentence, heading_id) ord, sentence, dependencies, heading_id
+                FROM staged_sentences
+                ORDER BY sentence, heading_id, ord
+              ) AS S
+              ORDER BY ord
+              ON CONFLICT (sentence, heading_id) DO UPDATE SET sentence = EXCLUDED.sentence
+              RETURNING sentence_id, sentence, heading_id
+            ), mapped AS (
+              INSERT INTO document_sentences (doc_id, sentence_id)
+              SELECT DISTINCT S.doc_id, I.sentence_id
+              FROM inserted AS I
+              JOIN staged_sentences AS S ON S.sentence = I.sentence AND S.heading_id = I.heading_id
+              WHERE S.doc_id IS NOT NULL
+              ON CONFLICT DO NOTHING
+            )
+            INSERT INTO normalizations (sentence_id, entity_id)
+            SELECT DISTINCT I.sentence_id, E.entity_id
+            FROM inserted AS I
+            JOIN staged_sentences AS S ON S.sentence = I.sentence AND S.heading_id = I.heading_id
+            JOIN staged_normalizations AS N ON N.ord = S.ord
+            JOIN entities AS E ON E.entity = N.entity
+            WHERE NOT EXISTS (SELECT 1 FROM normalizations AS X WHERE X.sentence_id = I.sentence_id)
+            ORDER BY I.sentence_id
+        ''')
+        self.sentences.clear()
+        self.normalizations.clear()
+        if self.api.autocommit:
+            self.api.conn.commit()
+        return count
+
+
+# Fuzzy entity match queries for each string Q.text (used as a lateral subquery)
+ENTITY_MATCH_QUERIES = {
+    FUZZY_MATCH_SCAN: '''
+        SELECT
+          entity_id,
+          length(entity) entity_length,
+          semantic_kb.levenshtein(entity, Q.text, 2, 1, 2) edit_distance
+        FROM
+          entities
+        WHERE
+          (length(entity) BETWEEN length(Q.text) AND {0})
+        AND (
+          entity LIKE Q.text || '%'
+          OR entity LIKE '%' || Q.text
+          OR semantic_kb.levenshtein(entity, Q.text, 2, 1, 2) < {1}
+        )
+        ORDER BY entity_length ASC, edit_distance ASC LIMIT 3
+    '''.format(MAX_ENTITY_LENGTH, ERROR_TOLERANCE),
+    FUZZY_MATCH_INDEXED: '''
+        SELECT entity_id, entity_length, edit_distance FROM (
+          SELECT
+            entity_id,
+            length(entity) entity_length,
+            semantic_kb.levenshtein(entity, Q.text, 2, 1, 2) edit_distance,
+            (entity LIKE Q.text || '%' OR entity LIKE '%' || Q.text) affix_match
+          FROM (
+            SELECT entity_id, entity FROM entities
+            WHERE
+              (length(entity) BETWEEN length(Q.text) AND {0})
+            AND (
+              entity LIKE Q.text || '%'
+              OR entity LIKE '%' || Q.text
+              OR entity OPERATOR(semantic_kb.%) Q.text
+            )
+            ORDER BY semantic_kb.similarity(entity, Q.text) DESC LIMIT {2}
+          ) AS candidates
+        ) AS ranked
+        WHERE affix_match OR edit_distance < {1}
+        ORDER BY entity_length ASC, edit_distance ASC LIMIT 3
+    '''.format(MAX_ENTITY_LENGTH, ERROR_TOLERANCE, TRGM_CANDIDATE_LIMIT),
+}
+
+
+def get_matching_entity_ids(input_entities: dict, ngram_level: int, match) -> dict:
+    """
+Get the entity ids matching the input entities as a dict of entity --> its direct/fuzzy matches
+    :param input_entities: dict of entity -> list of n-gram lists (see PostgresAPI.query_sentence_ids)
+    :param ngram_level: smallest n-gram size to match
+    :param match: function of string -> list of matching entity ids
+    :return: dict of entity -> list of matching entity ids
+    """
+    entity_ids = {}
+    for entity in input_entities:
+        entity_ids[entity] = []
+        # execute direct string match
+        entity_ids[entity] += match(entity)
+        # go through all ngrams until some entity match occurs, then break
+        if len(input_entities[entity]) < ngram_level:
+            continue
+        for ngrams in input_entities[entity][0: len(input_entities[entity]) - ngram_level + 1]:
+            for ngram in ngrams:
+                entity_ids[entity] += match(ngram)
+    return entity_ids
+
+
+def heading_match_query(input_entities: dict, non_empty_entities: list) -> str:
+    """
+Build the query returning (heading_id, sentence_ids) of the headings containing at least one entity of every group
+    :param input_entities: dict of entity -> list of matching entity ids
+    :param non_empty_entities: sorted entities that have matching entity ids
+    """
+    # ------------------------------------------
+    # --------------
+    # PARAMS
+    # Column parameter tells which column to return
+    column_param = '({0}) AS M'.format(
+        ' AND '.join(
+            'bool_or(E{0})'.format(x) for x in range(len(non_empty_entities))
+        )
+    )
+    # Entity parameter returns what elements triggered the sentence
+    entity_param = ', '.join(
+        '(array_agg(entity_id) && ARRAY[{0}]) AS E{1}'.format(str(input_entities[entity])[1:-1], i)
+        for i, entity in enumerate(non_empty_entities)
+    )
+    # Condition parameter filters results and return only matching results
+    condition_param = ' OR '.join(
+        'E{0} = TRUE'.format(x) for x in range(len(non_empty_entities))
+    )
+    # filter to give only relevant results
+    filter_param = 'M = TRUE'
+    # END OF PARAMS
+    # ---------------------
+    # ------------------------------------------
+    return '''
+        SELECT heading_id, sentence_ids FROM (
+            SELECT heading_id, array_agg(sentence_id) sentence_ids, {0} FROM
+            (SELECT DISTINCT sentence_id, {1} FROM normalizations GROUP BY sentence_id) AS TEMP
+            NATURAL JOIN sentences
+            NATURAL JOIN headings
+            WHERE {2}
+            GROUP BY heading_id
+        ) AS TBL
+        WHERE {3}
+        '''.format(column_param, entity_param, condition_param, filter_param)
+
+
+def frame_match_query(sent_ids: set, input_frames: set) -> str:
+    # Build the query returning whether any of the sentences has any of the frames
+    frame_param = str(input_frames)[1:-1]
+    sent_param = str(sent_ids)[1:-1]
+    # SELECT count(DISTINCT F.frame) FROM
+    #   (SELECT DISTINCT frame, unnest(sentence_ids) AS sentence_id FROM frames) AS F
+    # WHERE
+    #   F.frame IN ({0}) AND
+    #   F.sentence_id IN ({1})
+    return '''
+        SELECT EXISTS(SELECT 1 FROM frames WHERE frame IN ({1}) AND sentence_ids && ARRAY[{0}]) AS has_match
+        '''.format(sent_param, frame_param)
+
+
+class ConnectionPool:
+    """
+Thread-safe pool of database connections. Connections are checked out by one thread at a time, and are checked for
+health (SELECT 1) before being handed out again if they were idle for longer than the health check interval
+    """
+
+    def __init__(self, connect, min_size: int = POOL_MIN_SIZE, max_size: int = POOL_MAX_SIZE,
+                 timeout: float = POOL_TIMEOUT, health_check_interval: float = POOL_HEALTH_CHECK_INTERVAL) -> None:
+        """
+        :param connect: function that opens a new connection
+        :param min_size: number of connections opened upfront
+        :param max_size: maximum number of open connections
+        :param timeout: seconds to wait for a connection when all of them are checked out
+        :param health_check_interval: idle seconds after which a connection is checked before it is reused
+        """
+        super().__init__()
+        self.connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        # idle (connection, idle since) pairs, most recently returned last
+        self.idle = []
+        self.size = 0
+        self.condition = Condition()
+        for _ in range(min_size):
+            self.idle.append((self.connect(), monotonic()))
+            self.size += 1
+
+    @staticmethod
+    def __is_healthy(conn) -> bool:
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT 1')
+            cursor.fetchall()
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def __close(conn) -> None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def acquire(self):
+        """
+    Check out a connection. Reuses the most recently returned healthy connection, opens a new one if the pool is
+    not full, and waits for a connection to be returned otherwise
+        :return: connection
+        """
+        deadline = monotonic() + self.timeout
+        while True:
+            with self.condition:
+                while len(self.idle) == 0 and self.size >= self.max_size:
+                    remaining = deadline - monotonic()
+                    if remaining <= 0:
+                        raise IOError('No database connection available after %s seconds' % self.timeout)
+                    self.condition.wait(remaining)
+                if len(self.idle) == 0:
+                    # reserve a slot, and open the connection outside of the lock
+                    self.size += 1
+                    conn, idle_since = None, None
+                else:
+                    conn, idle_since = self.idle.pop()
+            if conn is None:
+                try:
+                    return self.connect()
+                except Exception:
+                    self.__discard(None)
+                    raise
+            if monotonic() - idle_since < self.health_check_interval or self.__is_healthy(conn):
+                return conn
+            self.__discard(conn)
+
+    def release(self, conn) -> None:
+        """
+    Return a checked out connection. Its open transaction is rolled back, and it is discarded if that fails
+        """
+        try:
+            conn.rollback()
+        except Exception:
+            self.__discard(conn)
+            return
+        with self.condition:
+            self.idle.append((conn, monotonic()))
+            self.condition.notify()
+
+    def __discard(self, conn) -> None:
+        if conn is not None:
+            self.__close(conn)
+        with self.condition:
+            self.size -= 1
+            self.condition.notify()
+
+    def close(self) -> None:
+        """
+    Close all idle connections
+        """
+        with self.condition:
+            while len(self.idle) > 0:
+                self.__close(self.idle.pop()[0])
+                self.size -= 1
+
+
 class PostgresAPI:
-    def __init__(self, user="semantic_kb", password="semantic_kb", database="semantic_kb", maintenance=False) -> None:
+    def __init__(self, user="semantic_kb", password="semantic_kb", database="semantic_kb", maintenance=False,
+                 fuzzy_match=FUZZY_MATCH_INDEXED, batch_lookup=True, pool_size: tuple = None) -> None:
+        """
+        :param pool_size: (min, max) connections of a connection pool. If set, each thread checks out its own
+        connection from the pool on first use, and returns it with release(). Otherwise (and always in maintenance
+        mode) one connection is shared
+        """
         super().__init__()
         self.maintenance = maintenance
+        self.fuzzy_match = fuzzy_match
+        # fuzzy match mode the KB supports (see update_match_mode), resolved on first use
+        self.match_mode = None
+        self.batch_lookup = batch_lookup
+        # optional in-memory entity index (core.engine.EntityIndex), used instead of querying for entity matches
+        self.entity_index = None
+        # optional in-memory postings index (core.engine.PostingsIndex), used instead of aggregating normalizations
+        self.postings_index = None
         self.schema_name = "semantic_kb" if not self.maintenance else "maintenance"
+        self.credentials = {'user': user, 'password': password, 'database': database}
         psql.paramstyle = 'qmark'
-        self.conn = psql.connect(user=user, password=password, database=database)
-        self.cursor = self.conn.cursor()
-        self.cursor.execute('''SET SEARCH_PATH TO {0}'''.format(self.schema_name))
         self.autocommit = False
+        self.local = local()
+        if pool_size is None or self.maintenance:
+            self.pool = None
+            self.__conn = self.connect()
+            self.__cursor = self.__conn.cursor()
+        else:
+            self.pool = ConnectionPool(self.connect, *pool_size)
         if self.maintenance:
             self.create_schema()
             self.conn.commit()
 
+    def connect(self):
+        # open a new connection, with the search path and trigram threshold of this api
+        conn = psql.connect(**self.credentials)
+        cursor = conn.cursor()
+        cursor.execute('''SET SEARCH_PATH TO {0}'''.format(self.schema_name))
+        cursor.execute('''SET pg_trgm.similarity_threshold = {0}'''.format(TRGM_SIMILARITY_THRESHOLD))
+        # commit the settings, so that they outlive the rollback when a pooled connection is returned
+        conn.commit()
+        return conn
+
+    def __checkout(self) -> tuple:
+        # connection and cursor of the current thread. pooled connections are checked out on first use
+        if self.pool is None:
+            return self.__conn, self.__cursor
+        if getattr(self.local, 'conn', None) is None:
+            self.local.conn = self.pool.acquire()
+            self.local.cursor = self.local.conn.cursor()
+        return self.local.conn, self.local.cursor
+
+    @property
+    def conn(self):
+        return self.__checkout()[0]
+
+    @property
+    def cursor(self):
+        return self.__checkout()[1]
+
+    def release(self) -> None:
+        """
+    Return the connection of the current thread to the pool (if pooled, and if the thread checked one out)
+        """
+        if self.pool is None or getattr(self.local, 'conn', None) is None:
+            return
+        conn, self.local.conn, self.local.cursor = self.local.conn, None, None
+        self.pool.release(conn)
+
     def initialize_db(self):
         self.drop_schema()
         self.create_schema()
@@ -77,8 +504,59 @@ class PostgresAPI:
             sentence_ids INTEGER[] DEFAULT '{}'
             )''')
 
+        # Create Table for precomputed heading features (used for scoring headings without pos-tagging them)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS heading_features (
+              heading TEXT PRIMARY KEY,
+              content_length INTEGER,
+              entities TEXT[],
+              frames TEXT[],
+              important_tokens TEXT
+            )''')
+
+        # Create Tables to track the content hash of each source document, and the sentences parsed from it (used to
+        # re-ingest only new or changed documents)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS documents (
+              doc_id TEXT PRIMARY KEY,
+              content_hash TEXT
+            )''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS document_sentences (
+              doc_id TEXT,
+              sentence_id INTEGER,
+              PRIMARY KEY (doc_id, sentence_id)
+            )''')
+
+        # Create Table for the checkpoints of populate runs (only in maintenance mode, where runs can be resumed)
+        if self.maintenance:
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS checkpoints (
+                  task TEXT PRIMARY KEY,
+                  position TEXT,
+                  done BOOLEAN DEFAULT FALSE
+                )''')
+
+        # Create Table for the version of the KB (single row), changed whenever the KB is replaced or updated
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS kb_version (
+              version TEXT
+            )''')
+
+        # Create Indexes to find the documents and normalizations of a sentence when documents are re-ingested
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS document_sentences_sentence_id_idx ON document_sentences (sentence_id)''')
+        cursor.execute('''CREATE INDEX IF NOT EXISTS normalizations_sentence_id_idx ON normalizations (sentence_id)''')
+
+        # Create GIN Index to serve overlap (&&) checks on sentence ids of frames
+        cursor.execute('''CREATE INDEX IF NOT EXISTS frames_sentence_ids_idx ON frames USING GIN (sentence_ids)''')
+
         # Add Fuzzy String match extensions for schema
         cursor.execute('''CREATE EXTENSION IF NOT EXISTS fuzzystrmatch SCHEMA semantic_kb''')
+        cursor.execute('''CREATE EXTENSION IF NOT EXISTS pg_trgm SCHEMA semantic_kb''')
+
+        # Create Trigram Index on entities for fuzzy entity lookup (also serves LIKE 'x%' and LIKE '%x')
+        self.create_trigram_index(cursor, self.schema_name)
 
         # Add ROOT Record for Headings. Every heading maps to this (To avoid foreign key violations)
         cursor.execute('''SELECT EXISTS(SELECT heading_id FROM headings WHERE heading_id = 1)''')
@@ -154,6 +632,12 @@ class PostgresAPI:
         if self.autocommit:
             self.conn.commit()
 
+    @staticmethod
+    def create_trigram_index(cursor, schema_name: str) -> None:
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS entities_entity_trgm_idx ON {0}.entities USING GIN (entity semantic_kb.gin_trgm_ops)
+        '''.format(schema_name))
+
     def drop_schema(self) -> None:
         cursor = self.conn.cursor()
         cursor.execute('''DROP SCHEMA IF EXISTS {0} CASCADE'''.format(self.schema_name))
@@ -164,7 +648,8 @@ class PostgresAPI:
         self.cursor.execute('''
             TRUNCATE 
             normalizations, headings, entities, 
-            sentences, frames, 
+            sentences, frames, heading_features, 
+            documents, document_sentences, 
             RESTART IDENTITY''')
         if self.autocommit:
             self.conn.commit()
@@ -215,6 +700,9 @@ class PostgresAPI:
         print('.', end='', flush=True)
         return int(sentence_id)
 
+    def bulk_writer(self, batch_size: int = BULK_BATCH_SIZE) -> BulkWriter:
+        return BulkWriter(self, batch_size)
+
     def insert_frames(self, sentence_id: str, frames: set) -> None:
         for frame in frames:
             self.cursor.execute('''
@@ -224,6 +712,188 @@ class PostgresAPI:
         if self.autocommit:
             self.conn.commit()
 
+    def insert_frame_postings(self, postings: dict) -> None:
+        """
+    Write frame postings built in memory. Each frame is written once, using a single COPY and a set-based upsert
+        :param postings: dict of frame -> list of sentence ids
+        """
+        if len(postings) == 0:
+            return
+        self.cursor.execute('''
+            CREATE TEMP TABLE IF NOT EXISTS staged_frames (
+              frame TEXT,
+              sentence_ids INTEGER[]
+            )''')
+        self.cursor.execute('''TRUNCATE staged_frames''')
+        copy_rows(self.cursor, 'staged_frames', ['frame', 'sentence_ids'],
+                  [(frame, str_conv(sorted(set(sentence_ids)))) for frame, sentence_ids in postings.items()])
+        self.cursor.execute('''
+            INSERT INTO frames (frame, sentence_ids)
+            SELECT frame, sentence_ids FROM staged_frames
+            ON CONFLICT (frame) DO UPDATE SET sentence_ids = ARRAY(
+              SELECT DISTINCT sentence_id FROM unnest(frames.sentence_ids || EXCLUDED.sentence_ids) AS sentence_id
+              ORDER BY sentence_id
+            )
+        ''')
+        if self.autocommit:
+            self.conn.commit()
+
+    def get_document_hashes(self) -> dict:
+        self.cursor.execute('SELECT doc_id, content_hash FROM documents')
+        return {doc_id: content_hash for doc_id, content_hash in self.cursor.fetchall()}
+
+    def upsert_document_hashes(self, hashes: dict) -> None:
+        """
+    Record the content hash of each ingested document, using a single COPY and a set-based upsert
+        :param hashes: dict of document id -> content hash
+        """
+        if len(hashes) == 0:
+            return
+        self.cursor.execute('''
+            CREATE TEMP TABLE IF NOT EXISTS staged_documents (
+              doc_id TEXT,
+              content_hash TEXT
+            )''')
+        self.cursor.execute('''TRUNCATE staged_documents''')
+        copy_rows(self.cursor, 'staged_documents', ['doc_id', 'content_hash'], list(hashes.items()))
+        self.cursor.execute('''
+            INSERT INTO documents (doc_id, content_hash)
+            SELECT doc_id, content_hash FROM staged_documents
+            ON CONFLICT (doc_id) DO UPDATE SET content_hash = EXCLUDED.content_hash
+        ''')
+        if self.autocommit:
+            self.conn.commit()
+
+    def delete_documents(self, doc_ids: list) -> int:
+        """
+    Remove documents from the KB, along with their sentences, normalizations and frame postings. Sentences that are
+    also part of another document are kept
+        :param doc_ids: list of document ids
+        :return: number of sentences removed
+        """
+        if len(doc_ids) == 0:
+            return 0
+        self.cursor.execute('''
+            CREATE TEMP TABLE IF NOT EXISTS staged_documents (
+              doc_id TEXT,
+              content_hash TEXT
+            )''')
+        self.cursor.execute('''
+            CREATE TEMP TABLE IF NOT EXISTS stale_sentences (
+              sentence_id INTEGER
+            )''')
+        self.cursor.execute('''TRUNCATE staged_documents, stale_sentences''')
+        copy_rows(self.cursor, 'staged_documents', ['doc_id'], [(doc_id,) for doc_id in doc_ids])
+        self.cursor.execute('DELETE FROM documents WHERE doc_id IN (SELECT doc_id FROM staged_documents)')
+        self.cursor.execute('''
+            WITH removed AS (
+              DELETE FROM document_sentences WHERE doc_id IN (SELECT doc_id FROM staged_documents)
+              RETURNING sentence_id
+            )
+            INSERT INTO stale_sentences (sentence_id)
+            SELECT DISTINCT sentence_id FROM removed
+        ''')
+        # keep the sentences still referenced by other documents
+        self.cursor.execute('''
+            DELETE FROM stale_sentences AS S
+            WHERE EXISTS (SELECT 1 FROM document_sentences AS D WHERE D.sentence_id = S.sentence_id)
+        ''')
+        self.cursor.execute('DELETE FROM normalizations WHERE sentence_id IN (SELECT sentence_id FROM stale_sentences)')
+        self.cursor.execute('''
+            UPDATE frames SET sentence_ids = ARRAY(
+              SELECT sentence_id FROM unnest(sentence_ids) AS sentence_id
+              WHERE sentence_id NOT IN (SELECT sentence_id FROM stale_sentences)
+              ORDER BY sentence_id
+            )
+            WHERE sentence_ids && (SELECT array_agg(sentence_id) FROM stale_sentences)
+        ''')
+        self.cursor.execute("DELETE FROM frames WHERE sentence_ids = '{}'")
+        self.cursor.execute('DELETE FROM sentences WHERE sentence_id IN (SELECT sentence_id FROM stale_sentences)')
+        count = self.cursor.rowcount
+        if self.autocommit:
+            self.conn.commit()
+        return count
+
+    def get_document_sentences(self, doc_ids: list) -> next:
+        self.cursor.execute('''
+            SELECT DISTINCT sentence_id, sentence FROM sentences
+            NATURAL JOIN document_sentences
+            WHERE doc_id = ANY(?::TEXT[])
+        ''', [list(doc_ids)])
+        for row in self.cursor.fetchall():
+            yield (row[0], (tuple(str.rsplit(tag, SPLIT_CHAR, 1)) for tag in row[1].split()))
+
+    def get_checkpoint(self, task: str) -> tuple:
+        """
+    Get the checkpoint of a populate task of an unfinished run
+        :param task: name of the task
+        :return: (position, done) tuple, or None if the task has no checkpoint
+        """
+        self.cursor.execute('SELECT position, done FROM checkpoints WHERE task = ?', [task])
+        row = self.cursor.fetchone()
+        return None if row is None else (row[0], row[1])
+
+    def set_checkpoint(self, task: str, position, done: bool = False) -> None:
+        # recorded in the transaction of the batch it marks, so a checkpoint is only visible once the batch is committed
+        self.cursor.execute('''
+            INSERT INTO checkpoints (task, position, done) VALUES (?,?,?)
+            ON CONFLICT (task) DO UPDATE SET position = EXCLUDED.position, done = EXCLUDED.done
+        ''', [task, None if position is None else str(position), done])
+        if self.autocommit:
+            self.conn.commit()
+
+    def try_advisory_lock(self, key: int) -> bool:
+        """
+    Take a session-level advisory lock, held (across commits and rollbacks) until the connection is closed
+        :param key: key of the lock
+        :return: True if the lock was taken, False if another session holds it
+        """
+        self.cursor.execute('SELECT pg_try_advisory_lock(?)', [key])
+        return self.cursor.fetchone()[0]
+
+    def set_kb_version(self) -> str:
+        # recorded in the transaction of the changes it marks, so a new version is only visible along with them
+        version = uuid4().hex
+        self.cursor.execute('DELETE FROM kb_version')
+        self.cursor.execute('INSERT INTO kb_version (version) VALUES (?)', [version])
+        return version
+
+    def get_kb_version(self) -> str:
+        # KBs populated before versions were introduced do not have the table
+        self.cursor.execute("SELECT to_regclass('kb_version') IS NOT NULL")
+        if not self.cursor.fetchone()[0]:
+            return None
+        self.cursor.execute('SELECT version FROM kb_version')
+        row = self.cursor.fetchone()
+        return None if row is None else row[0]
+
+    def get_distinct_headings(self) -> list:
+        self.cursor.execute('SELECT DISTINCT heading FROM headings WHERE heading_id <> 1 ORDER BY heading')
+        return [heading for (heading,) in self.cursor.fetchall()]
+
+    def insert_heading_features(self, features: dict) -> None:
+        """
+    Write precomputed heading features with a single COPY
+        :param features: dict of heading -> (content length, entities, frames, important tokens)
+        """
+        if len(features) == 0:
+            return
+        columns = ['heading', 'content_length', 'entities', 'frames', 'important_tokens']
+        copy_rows(self.cursor, 'heading_features', columns,
+                  [(heading, content_length, array_literal(sorted(entities)), array_literal(sorted(frames)), tokens)
+                   for heading, (content_length, entities, frames, tokens) in features.items()])
+        if self.autocommit:
+            self.conn.commit()
+
+    def get_heading_features(self) -> dict:
+        # KBs populated before heading features were introduced do not have the table
+        self.cursor.execute("SELECT to_regclass('heading_features') IS NOT NULL")
+        if not self.cursor.fetchone()[0]:
+            return {}
+        self.cursor.execute('SELECT heading, content_length, entities, frames, important_tokens FROM heading_features')
+        return {heading: (content_length, set(entities or []), set(frames or []), tokens)
+                for heading, content_length, entities, frames, tokens in self.cursor.fetchall()}
+
     def get_heading_hierarchy(self, heading_id: int) -> list:
         self.cursor.execute('''
             SELECT heading_id, heading, index FROM get_hierarchy(?)
@@ -241,19 +911,109 @@ class PostgresAPI:
             if row is not None:
                 yield (row[0], (tuple(str.rsplit(tag, SPLIT_CHAR, 1)) for tag in row[1].split()))
 
-    def get_all_sentences(self) -> next:
-        self.cursor.execute('SELECT sentence_id, sentence FROM sentences')
+    def get_sentences_by_ids(self, sentence_ids: list) -> dict:
+        """
+    Fetch many sentences in one query
+        :param sentence_ids: list of sentence ids
+        :return: dict of sentence_id -> list of pos tags, ordered by sentence id. missing ids are left out
+        """
+        sentence_ids = sorted(set(int(x) for x in sentence_ids))
+        if len(sentence_ids) == 0:
+            return {}
+        self.cursor.execute('''
+          SELECT sentence_id, sentence FROM sentences
+          WHERE sentence_id = ANY(?::INTEGER[])
+          ORDER BY sentence_id ASC
+        ''', [sentence_ids])
+        return {
+            row[0]: [tuple(str.rsplit(tag, SPLIT_CHAR, 1)) for tag in row[1].split()] for row in self.cursor.fetchall()
+        }
+
+    def get_all_sentences(self, after_id: int = 0) -> next:
+        self.cursor.execute('SELECT sentence_id, sentence FROM sentences WHERE sentence_id > ? ORDER BY sentence_id',
+                            [after_id])
         for row in self.cursor.fetchall():
             yield (row[0], (tuple(str.rsplit(tag, SPLIT_CHAR, 1)) for tag in row[1].split()))
 
-    def get_sentence_count(self) -> int:
-        self.cursor.execute('SELECT count(sentence_id) FROM sentences')
+    def get_sentence_count(self, after_id: int = 0) -> int:
+        self.cursor.execute('SELECT count(sentence_id) FROM sentences WHERE sentence_id > ?', [after_id])
         return self.cursor.fetchone()[0]
 
     def get_all_entities(self) -> tuple:
         self.cursor.execute('SELECT entity_id, entity FROM entities ORDER BY entity')
         return self.cursor.fetchall()
 
+    def get_entity_postings(self) -> list:
+        self.cursor.execute('''
+            SELECT entity_id, array_agg(DISTINCT sentence_id ORDER BY sentence_id) FROM normalizations
+            GROUP BY entity_id
+        ''')
+        return self.cursor.fetchall()
+
+    def get_sentence_headings(self) -> list:
+        self.cursor.execute('SELECT sentence_id, heading_id FROM sentences')
+        return self.cursor.fetchall()
+
+    def get_postings_snapshot(self) -> tuple:
+        """
+    Get the entity postings and the sentence headings from one snapshot of the KB, so that documents re-ingested
+    meanwhile are either in both or in neither
+        :return: (postings, sentence_headings) tuple (see get_entity_postings and get_sentence_headings)
+        """
+        # end the current transaction, so that both queries run in a new one with a single snapshot
+        self.conn.rollback()
+        self.cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+        try:
+            return self.get_entity_postings(), self.get_sentence_headings()
+        finally:
+            self.conn.rollback()
+
+    def update_match_mode(self) -> str:
+        """
+    Resolve the fuzzy match mode the KB supports: indexed matching falls back to scanning on KBs without the trigram
+    index (KBs populated before it was introduced may not have pg_trgm either)
+        :return: fuzzy match mode
+        """
+        self.match_mode = self.fuzzy_match
+        if self.fuzzy_match == FUZZY_MATCH_INDEXED:
+            self.cursor.execute("SELECT to_regclass('entities_entity_trgm_idx') IS NOT NULL")
+            if not self.cursor.fetchone()[0]:
+                self.match_mode = FUZZY_MATCH_SCAN
+        return self.match_mode
+
+    def match_entity(self, text: str) -> list:
+        """
+    Fuzzy-match a string against the KB entities, and return the ids of the top 3 matches (shortest first, then
+    closest). In indexed mode, candidates are shortlisted using the trigram index, and only the shortlist is ranked
+    by edit distance
+        :param text: normalized entity or n-gram
+        :return: list of entity ids
+        """
+        return self.match_entities([text]).get(text, [])
+
+    def match_entities(self, texts: list) -> dict:
+        """
+    Fuzzy-match many strings against the KB entities in a single query (see match_entity)
+        :param texts: normalized entities and/or n-grams
+        :return: dict of string -> list of matching entity ids
+        """
+        texts = sorted(set(texts))
+        if len(texts) == 0:
+            return {}
+        if self.entity_index is not None:
+            return {text: self.entity_index.match(text) for text in texts}
+        match_mode = self.match_mode if self.match_mode is not None else self.update_match_mode()
+        self.cursor.execute('''
+            SELECT Q.text, M.entity_id
+            FROM unnest(?::TEXT[]) AS Q(text)
+            CROSS JOIN LATERAL ({0}) AS M
+            ORDER BY Q.text, M.entity_length ASC, M.edit_distance ASC
+        '''.format(ENTITY_MATCH_QUERIES[match_mode]), [texts])
+        matches = {text: [] for text in texts}
+        for text, entity_id in self.cursor.fetchall():
+            matches[text] += [int(entity_id)]
+        return matches
+
     def query_sentence_ids(self, entities: dict, frames: set) -> dict:
         """
         Accepts a set of entities, a set of frames, and a filtering algorithm to generate a set of sentence id groups
@@ -265,39 +1025,12 @@ class PostgresAPI:
         """
         n = max(len(x.split()) for x in entities)
 
-        # Get the entity ids matching the input entities as a dict of entity --> its direct/fuzzy matches
-        def get_matching_entity_ids(input_entities: dict, ngram_level: int) -> dict:
-            entity_ids = {}
-            q_string = '''
-            SELECT 
-              entity_id, 
-              length(entity) entity_length,
-              semantic_kb.levenshtein(entity, '{0}', 2, 1, 2) edit_distance
-            FROM 
-              entities
-            WHERE
-              (length(entity) BETWEEN length('{0}') AND {1})
-            AND (
-              entity LIKE '{0}%%' 
-              OR entity LIKE '%%{0}' 
-              OR semantic_kb.levenshtein(entity, '{0}', 2, 1, 2) < {2}
-            ) 
-            ORDER BY entity_length ASC, edit_distance ASC LIMIT 3
-            '''
-            for entity in input_entities:
-                entity_ids[entity] = []
-                # execute direct string match
-                self.cursor.execute(q_string.format(entity, MAX_ENTITY_LENGTH, ERROR_TOLERANCE))
-                # get set of rows and append to matching_entity_ids set
-                entity_ids[entity] += [int(row[0]) for row in self.cursor.fetchall()]
-                # go through all ngrams until some entity match occurs, then break
-                if len(input_entities[entity]) < ngram_level:
-                    continue
-                for ngrams in input_entities[entity][0: len(input_entities[entity]) - ngram_level + 1]:
-                    for ngram in ngrams:
-                        self.cursor.execute(q_string.format(ngram, MAX_ENTITY_LENGTH, ERROR_TOLERANCE))
-                        entity_ids[entity] += [int(row[0]) for row in self.cursor.fetchall()]
-            return entity_ids
+        # In batch mode, match every entity and n-gram of every level in one query, and resolve each level from it
+        candidates = list(entities) + [ngram for entity in entities for grams in entities[entity] for ngram in grams]
+        lookup = self.match_entities(candidates) if self.batch_lookup else None
+
+        def match(text: str) -> list:
+            return lookup[text] if lookup is not None else self.match_entity(text)
 
         # Get the sentence ids of the sentences containing the passed entity ids
         def get_entity_matching_sent_ids(input_entities: dict) -> dict:
@@ -309,43 +1042,11 @@ class PostgresAPI:
             # If no non-empty entity matches found in database, return empty result
             if len(non_empty_entities) == 0:
                 return {}
-            # ------------------------------------------
-            # --------------
-            # PARAMS
-            # Column parameter tells which column to return
-            column_param = '({0}) AS M'.format(
-                ' AND '.join(
-                    'bool_or(E{0})'.format(x) for x in range(len(non_empty_entities))
-                )
-            )
-            # Entity parameter returns what elements triggered the sentence
-            entity_param = ', '.join(
-                '(array_agg(entity_id) && ARRAY[{0}]) AS E{1}'.format(str(input_entities[entity])[1:-1], i)
-                for i, entity in enumerate(non_empty_entities)
-            )
-            # Condition parameter filters results and return only matching results
-            condition_param = ' OR '.join(
-                'E{0} = TRUE'.format(x) for x in range(len(non_empty_entities))
-            )
-            # filter to give only relevant results
-            filter_param = 'M = TRUE'
-            # END OF PARAMS
-            # ---------------------
-            # ------------------------------------------
+            # Intersect the precomputed postings if loaded
+            if self.postings_index is not None:
+                return self.postings_index.match_headings([input_entities[entity] for entity in non_empty_entities])
             # Execute the query using the params
-            self.cursor.execute(
-                '''
-                SELECT heading_id, sentence_ids FROM (
-                    SELECT heading_id, array_agg(sentence_id) sentence_ids, {0} FROM
-                    (SELECT DISTINCT sentence_id, {1} FROM normalizations GROUP BY sentence_id) AS TEMP
-                    NATURAL JOIN sentences
-                    NATURAL JOIN headings
-                    WHERE {2}
-                    GROUP BY heading_id
-                ) AS TBL
-                WHERE {3}
-                '''.format(column_param, entity_param, condition_param, filter_param)
-            )
+            self.cursor.execute(heading_match_query(input_entities, non_empty_entities))
             # Return the matching sentence_ids grouped under each heading_id
             return {heading: sentence_ids for heading, sentence_ids in self.cursor.fetchall()}
 
@@ -354,18 +1055,7 @@ class PostgresAPI:
             if len(sent_ids) == 0 or len(input_frames) == 0:
                 return False
             else:
-                frame_param = str(input_frames)[1:-1]
-                sent_param = str(sent_ids)[1:-1]
-                # self.cursor.execute('''
-                #     SELECT count(DISTINCT F.frame) FROM
-                #       (SELECT DISTINCT frame, unnest(sentence_ids) AS sentence_id FROM frames) AS F
-                #     WHERE
-                #       F.frame IN ({0}) AND
-                #       F.sentence_id IN ({1})
-                # '''.format(frame_param, sent_param))
-                self.cursor.execute('''
-                    SELECT bool_or(sentence_ids && ARRAY[{0}]) AS has_match FROM frames WHERE frame IN ({1})
-                    '''.format(sent_param, frame_param))
+                self.cursor.execute(frame_match_query(sent_ids, input_frames))
                 result = self.cursor.fetchone()[0]
                 return result
 
@@ -375,7 +1065,7 @@ class PostgresAPI:
 
         # Step down ngram size until at least one heading group returned
         for i in range(n, 0, -1):
-            entity_ids_dict = get_matching_entity_ids(entities, i)
+            entity_ids_dict = get_matching_entity_ids(entities, i, match)
             h_grp_match_dict = get_entity_matching_sent_ids(entity_ids_dict)
             if len(h_grp_match_dict) >= MIN_RESULT_COUNT:
                 break
@@ -434,8 +1124,14 @@ class PostgresAPI:
 
     def commit(self):
         if self.maintenance:
+            # checkpoints only describe the run being committed
+            self.cursor.execute('DROP TABLE IF EXISTS checkpoints')
+            self.set_kb_version()
             self.cursor.execute('DROP SCHEMA IF EXISTS semantic_kb CASCADE')
             self.cursor.execute('ALTER SCHEMA maintenance RENAME TO semantic_kb')
             self.cursor.execute('''CREATE EXTENSION IF NOT EXISTS fuzzystrmatch SCHEMA semantic_kb''')
+            self.cursor.execute('''CREATE EXTENSION IF NOT EXISTS pg_trgm SCHEMA semantic_kb''')
+            # the trigram index depends on the extension dropped along with the old schema, so recreate it
+            self.create_trigram_index(self.cursor, 'semantic_kb')
             self.create_schema()
         self.conn.commit()
@@ -1,25 +1,241 @@
-from socket import socket
+import asyncio
+from queue import (Empty, Full, LifoQueue)
+from socket import (socket, timeout as SocketTimeout)
+
+
+class TaggerConnection:
+    """
+A connection to the MaxentTaggerServer. Requests and responses are framed by newlines. The stock server answers one
+request per connection and then closes it, so a connection is only long-lived with servers that keep it open
+    """
+    NEWLINE = b'\n'
+
+    def __init__(self, host: str, port: int, buffer: int, timeout: float) -> None:
+        super().__init__()
+        self.buffer = buffer
+        self.socket = socket()
+        self.socket.settimeout(timeout)
+        self.socket.connect((host, port))
+        self.pending = b''
+        self.closed = False
+
+    def send_lines(self, messages: list) -> None:
+        payload = b''.join(message.strip().encode('ascii', 'ignore') + b'\r' + self.NEWLINE for message in messages)
+        self.socket.sendall(payload)
+
+    def read_line(self) -> bytes:
+        """
+    Read one newline-framed response. If the server closes the connection, the data received so far is treated as
+    the final frame, and the connection is marked as closed
+        :return: response bytes, or None if the connection closed without sending any more data
+        """
+        while self.NEWLINE not in self.pending:
+            try:
+                data = self.socket.recv(self.buffer)
+            except ConnectionResetError:
+                # a server closing right after answering may reset the connection instead, in which case the data
+                # received so far is still its final frame
+                if self.pending.strip() == b'':
+                    raise
+                data = b''
+            if data == b'':
+                self.closed = True
+                result, self.pending = self.pending, b''
+                return result if result.strip() != b'' else None
+            self.pending += data
+        result, self.pending = self.pending.split(self.NEWLINE, 1)
+        return result
+
+    def close(self) -> None:
+        self.closed = True
+        self.socket.close()
 
 
 class StanfordAPI:
     SPLIT_CHAR = '__'
 
-    def __init__(self, port: int = 6000, buffer: int = 4096) -> None:
+    def __init__(self, port: int = 6000, buffer: int = 4096, pool_size: int = 4, timeout: float = 60) -> None:
         super().__init__()
         self.host = '127.0.0.1'
         self.port = port
         self.buffer = buffer
+        self.timeout = timeout
+        self.pool = LifoQueue(maxsize=pool_size)
+        # whether the server keeps connections open after answering (None until known). once a server is known to
+        # close them, connections are not pooled
+        self.keep_alive = None
+
+    def __checkout(self) -> tuple:
+        # reuse the most recently returned connection, or open a new one if the pool is empty
+        try:
+            return self.pool.get_nowait(), True
+        except Empty:
+            return TaggerConnection(self.host, self.port, self.buffer, self.timeout), False
+
+    def __checkin(self, conn: TaggerConnection) -> None:
+        # keep the connection only if the server left it open (and keeps connections open), and the pool has room
+        if conn.closed or self.keep_alive is False:
+            conn.close()
+            return
+        try:
+            self.pool.put_nowait(conn)
+        except Full:
+            conn.close()
+
+    def __parse(self, result: bytes) -> list:
+        return [tuple(x.rsplit(self.SPLIT_CHAR, 1)) for x in str(result, 'ascii', 'ignore').strip().split()]
+
+    def close(self) -> None:
+        """
+    Close all idle connections in the pool
+        """
+        while True:
+            try:
+                self.pool.get_nowait().close()
+            except Empty:
+                break
 
     def pos_tag(self, message: str) -> next:
-        with socket() as s:
-            s.connect((self.host, self.port))
-            s.send(message.strip().encode('ascii', 'ignore') + b'\r' + b'\n')
-            result = b''
-            while True:
-                data = s.recv(self.buffer)
-                if data == b'':
-                    break
+        yield from self.pos_tag_many([message])[0]
+
+    def pos_tag_many(self, messages: list) -> list:
+        """
+    POS-tag many sentences, one at a time: each sentence is sent once the previous answer was read, as the stock
+    server reads a single line per connection. Connections are reused if the server keeps them open
+        :param messages: list of sentences (one sentence per message)
+        :return: list of pos-tag lists, in the same order as the messages
+        """
+        return [self.__tag(message) for message in messages]
+
+    def __tag(self, message: str) -> list:
+        while True:
+            conn, reused = self.__checkout()
+            try:
+                conn.send_lines([message])
+                response = conn.read_line()
+            except SocketTimeout:
+                conn.close()
+                raise
+            except OSError:
+                conn.close()
+                if reused:
+                    response = None
+                else:
+                    raise
+            finally:
+                self.__checkin(conn)
+            if response is None:
+                # a reused connection without an answer was closed by the server after its previous answer, so drop
+                # it and retry
+                if reused:
+                    if self.keep_alive is None:
+                        self.keep_alive = False
+                    continue
+                # a fresh connection that closed without answering means the server is not responding
+                raise IOError('Stanford server on port %d closed the connection without a response' % self.port)
+            if reused:
+                self.keep_alive = True
+            return self.__parse(response)
+
+
+class AsyncStanfordAPI:
+    """
+asyncio client of the MaxentTaggerServer, with the same pooling and one sentence per request as StanfordAPI. Must be
+used from a single event loop
+    """
+    SPLIT_CHAR = '__'
+    NEWLINE = b'\n'
+
+    def __init__(self, port: int = 6000, buffer: int = 4096, pool_size: int = 16, timeout: float = 60) -> None:
+        super().__init__()
+        self.host = '127.0.0.1'
+        self.port = port
+        self.buffer = buffer
+        self.timeout = timeout
+        self.pool_size = pool_size
+        # idle (reader, writer) pairs, most recently returned last
+        self.pool = []
+        # whether the server keeps connections open after answering (see StanfordAPI)
+        self.keep_alive = None
+
+    async def __checkout(self) -> tuple:
+        # reuse the most recently returned connection, or open a new one if the pool is empty
+        if len(self.pool) > 0:
+            return self.pool.pop(), True
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.timeout)
+        return (reader, writer), False
+
+    def __checkin(self, conn: tuple, closed: bool) -> None:
+        # keep the connection only if the server left it open (and keeps connections open), and the pool has room
+        if closed or self.keep_alive is False:
+            conn[1].close()
+        elif len(self.pool) < self.pool_size:
+            self.pool.append(conn)
+        else:
+            conn[1].close()
+
+    def __parse(self, result: bytes) -> list:
+        return [tuple(x.rsplit(self.SPLIT_CHAR, 1)) for x in str(result, 'ascii', 'ignore').strip().split()]
+
+    def close(self) -> None:
+        """
+    Close all idle connections in the pool
+        """
+        while len(self.pool) > 0:
+            self.pool.pop()[1].close()
+
+    async def __read_line(self, reader: asyncio.StreamReader) -> tuple:
+        """
+    Read one newline-framed response (see TaggerConnection.read_line)
+        :return: (response bytes or None, whether the server closed the connection) tuple
+        """
+        pending = b''
+        while self.NEWLINE not in pending:
+            try:
+                data = await asyncio.wait_for(reader.read(self.buffer), self.timeout)
+            except ConnectionResetError:
+                if pending.strip() == b'':
+                    raise
+                data = b''
+            if data == b'':
+                return (pending if pending.strip() != b'' else None), True
+            pending += data
+        return pending.split(self.NEWLINE, 1)[0], False
+
+    async def pos_tag_many(self, messages: list) -> list:
+        """
+    POS-tag many sentences, one at a time (see StanfordAPI.pos_tag_many)
+        :param messages: list of sentences (one sentence per message)
+        :return: list of pos-tag lists, in the same order as the messages
+        """
+        return [await self.__tag(message) for message in messages]
+
+    async def __tag(self, message: str) -> list:
+        while True:
+            (reader, writer), reused = await self.__checkout()
+            closed = True
+            try:
+                writer.write(message.strip().encode('ascii', 'ignore') + b'\r' + self.NEWLINE)
+                await asyncio.wait_for(writer.drain(), self.timeout)
+                response, closed = await self.__read_line(reader)
+            except asyncio.TimeoutError:
+                raise
+            except OSError:
+                if reused:
+                    response = None
                 else:
-                    result += data
-        for x in str(result, 'ascii', 'ignore').strip().split():
-            yield tuple(x.rsplit(self.SPLIT_CHAR, 1))
+                    raise
+            finally:
+                self.__checkin((reader, writer), closed)
+            if response is None:
+                # a reused connection without an answer was closed by the server after its previous answer, so drop
+                # it and retry
+                if reused:
+                    if self.keep_alive is None:
+                        self.keep_alive = False
+                    continue
+                # a fresh connection that closed without answering means the server is not responding
+                raise IOError('Stanford server on port %d closed the connection without a response' % self.port)
+            if reused:
+                self.keep_alive = True
+            return self.__parse(response)
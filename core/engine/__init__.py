@@ -1 +1,5 @@
+from core.engine.answer_cache import AnswerCache
+from core.engine.frame_cache import FrameCache
 from core.engine.msg_engine import MessageEngine
+from core.engine.entity_index import EntityIndex
+from core.engine.postings_index import PostingsIndex
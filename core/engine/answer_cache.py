@@ -0,0 +1,71 @@
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+
+
+class AnswerCache:
+    """
+Thread-safe LRU cache of answers with a time-to-live. Entries are evicted when the cache is full (least recently used
+first), or when they are older than the TTL
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 3600) -> None:
+        """
+        :param max_size: maximum number of cached entries
+        :param ttl: maximum age of an entry in seconds
+        """
+        super().__init__()
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # incremented on every clear, so that values computed before a clear are not cached after it
+        self.generation = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key):
+        """
+    Return the cached value of a key, or None if it is not cached (or expired)
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and monotonic() - entry[0] > self.ttl:
+                del self.entries[key]
+                self.evictions += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value, generation: int = None) -> None:
+        """
+    Cache a value
+        :param key: cache key
+        :param value: value to cache
+        :param generation: the generation the value was computed in. ignored if the cache was cleared since then
+        """
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+            self.entries[key] = (monotonic(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.generation += 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {'size': len(self.entries), 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
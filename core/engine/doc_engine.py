@@ -1,3 +1,5 @@
+import hashlib
+import json
 import re
 
 from core.api import MongoAPI
@@ -6,13 +8,27 @@ from core.parsers import (MarkdownParser, nlp)
 RE_PRODUCT = re.compile(r'/display/(.+?)(?=/|$)')
 
 
+def get_doc_sections(data: dict) -> next:
+    """
+Break one scraped document into its sections
+    :param data: document from the scraped_docs collection
+    :return: generator of (heading_list, sentences) tuples, in document order
+    """
+    product = RE_PRODUCT.search(data['_id']).group(1)
+    for heading_list, sentences in MarkdownParser.unmarkdown(data['content'], data['heading'], product):
+        yield (heading_list, [sent for sents in sentences for sent in nlp.sent_tokenize(sents)])
+
+
+def get_doc_hash(data: dict) -> str:
+    # hash of the fields a document is parsed from, used to detect changed documents between populate runs
+    return hashlib.sha1(json.dumps([data['heading'], data['content']]).encode('utf-8')).hexdigest()
+
+
 def get_doc_content(mongo_api: MongoAPI):
     # Load required tools and data
     training_data = mongo_api.get_all_documents(mongo_api.SCRAPED_DOCS)
 
     for i, data in enumerate(training_data):
         # Iterate through each sentence of the contents and populate KB
-        product = RE_PRODUCT.search(data['_id']).group(1)
-        for heading_list, sentences in MarkdownParser.unmarkdown(data['content'], data['heading'], product):
-            yield (heading_list, [sent for sents in sentences for sent in nlp.sent_tokenize(sents)])
+        yield from get_doc_sections(data)
         yield (None, None)
@@ -0,0 +1,118 @@
+from bisect import bisect_left
+
+from core.api.postgres_api import (ERROR_TOLERANCE, MAX_ENTITY_LENGTH)
+
+# Same edit costs as the fuzzy entity match queries in PostgresAPI
+MAX_RESULT_COUNT = 3
+INSERT_COST = 2
+DELETE_COST = 1
+SUBSTITUTE_COST = 2
+
+
+class EntityIndex:
+    """
+In-memory index of KB entities, for fuzzy entity lookup without querying the database. Entities are bucketed by
+length. Each bucket is kept sorted (for prefix search), sorted in reverse (for suffix search), and grouped by character
+mask (for bounded edit-distance search).
+Matches follow the fuzzy entity match queries in PostgresAPI: entities at least as long as the text, that start or
+end with it, or are within the edit distance tolerance, ordered by length and then by edit distance
+    """
+
+    def __init__(self, entities: list) -> None:
+        """
+        :param entities: list of (entity_id, entity) rows, as returned by PostgresAPI.get_all_entities
+        """
+        super().__init__()
+        self.entity_ids = {}
+        self.buckets = {}
+        self.reversed_buckets = {}
+        for entity_id, entity in entities:
+            self.entity_ids[entity] = int(entity_id)
+            self.buckets.setdefault(len(entity), []).append(entity)
+            self.reversed_buckets.setdefault(len(entity), []).append(entity[::-1])
+        self.masks = {}
+        for length in self.buckets:
+            self.buckets[length].sort()
+            self.reversed_buckets[length].sort()
+            # group the words of each bucket by character mask, so that the distance bound is computed once per mask
+            self.masks[length] = {}
+            for entity in self.buckets[length]:
+                self.masks[length].setdefault(EntityIndex.char_mask(entity), []).append(entity)
+        self.max_length = min(max(self.buckets.keys(), default=0), MAX_ENTITY_LENGTH)
+
+    def __len__(self) -> int:
+        return len(self.entity_ids)
+
+    @staticmethod
+    def __prefix_range(words: list, prefix: str) -> list:
+        return words[bisect_left(words, prefix):bisect_left(words, prefix + '\uffff')]
+
+    @staticmethod
+    def edit_distance(source: str, target: str) -> int:
+        """
+    Weighted levenshtein distance to transform source into target (same as levenshtein(source, target, 2, 1, 2) of
+    the fuzzystrmatch extension)
+        """
+        row = [j * INSERT_COST for j in range(len(target) + 1)]
+        for c in source:
+            prev_row, row = row, [row[0] + DELETE_COST]
+            for j, t in enumerate(target):
+                row.append(min(prev_row[j + 1] + DELETE_COST, row[j] + INSERT_COST,
+                               prev_row[j] + (0 if c == t else SUBSTITUTE_COST)))
+        return row[-1]
+
+    @staticmethod
+    def char_mask(text: str) -> int:
+        # bit mask of the distinct characters in the text
+        mask = 0
+        for c in text:
+            mask |= 1 << (ord(c) & 63)
+        return mask
+
+    def __search_bucket(self, length: int, text: str) -> list:
+        """
+    Find words of one length bucket within the edit distance tolerance of the text. Words are first filtered using
+    a lower bound of the distance computed from character masks, and only the remaining words are compared
+        :return: list of (edit_distance, word)
+        """
+        results = []
+        text_mask = EntityIndex.char_mask(text)
+        min_distance = (length - len(text)) * DELETE_COST
+        for mask, words in self.masks[length].items():
+            # each character of the text missing in the word needs an insertion or a substitution, and each
+            # character of the word missing in the text needs a deletion or a substitution. deletions beyond the
+            # length difference need an insertion each, so substitutions are the cheapest way to cover both
+            missing = bin(text_mask & ~mask).count('1')
+            extra = bin(mask & ~text_mask).count('1') - (length - len(text))
+            if min_distance + max(missing, extra, 0) * SUBSTITUTE_COST >= ERROR_TOLERANCE:
+                continue
+            for word in words:
+                distance = EntityIndex.edit_distance(word, text)
+                if distance < ERROR_TOLERANCE:
+                    results += [(distance, word)]
+        return results
+
+    def match(self, text: str) -> list:
+        """
+    Fuzzy-match a string against the indexed entities
+        :param text: normalized entity or n-gram
+        :return: ids of the top 3 matches (shortest first, then closest)
+        """
+        results = []
+        # walk buckets from the shortest eligible length, and stop once enough matches are found
+        for length in range(len(text), self.max_length + 1):
+            if len(results) >= MAX_RESULT_COUNT:
+                break
+            if length not in self.buckets:
+                continue
+            # prefix and suffix matches only need deletions, so they have the least possible distance in the bucket
+            min_distance = (length - len(text)) * DELETE_COST
+            affix_matches = set(self.__prefix_range(self.buckets[length], text))
+            affix_matches.update(w[::-1] for w in self.__prefix_range(self.reversed_buckets[length], text[::-1]))
+            matches = {word: min_distance for word in affix_matches}
+            # search for other words within tolerance if the affix matches are not enough
+            if len(matches) < MAX_RESULT_COUNT - len(results) and min_distance < ERROR_TOLERANCE:
+                for distance, word in self.__search_bucket(length, text):
+                    matches.setdefault(word, distance)
+            results += sorted((distance, word) for word, distance in matches.items())
+        return [self.entity_ids[word] for distance, word in results[:MAX_RESULT_COUNT]]
@@ -0,0 +1,81 @@
+from collections import OrderedDict
+from threading import Lock
+
+
+class FrameCache:
+    """
+Thread-safe LRU cache of the frames of word__pos keys, bounded by entry count. Keys missing from the cache are looked
+up in the store (if any) before being reported as missing, and keys added to the cache are written through to it
+    """
+
+    def __init__(self, max_size: int = 100000, store=None) -> None:
+        """
+        :param max_size: maximum number of cached keys (least recently used keys are evicted first)
+        :param store: fallback store (i.e. core.api.FrameStore), with get(key) and put(key, value) methods
+        """
+        super().__init__()
+        self.max_size = max_size
+        self.store = store
+        self.entries = OrderedDict()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def __getitem__(self, key: str) -> list:
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value: list) -> None:
+        with self.lock:
+            self.__insert(key, value)
+        if self.store is not None:
+            self.store.put(key, value)
+
+    def __insert(self, key: str, value: list) -> None:
+        # must hold the lock
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key: str, default: list = None) -> list:
+        """
+    Return the frames of a key from the cache, or from the store on a cache miss
+        """
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+        # look up the store outside the lock, so that other lookups are not blocked meanwhile
+        value = self.store.get(key) if self.store is not None else None
+        if value is None:
+            return default
+        with self.lock:
+            self.__insert(key, value)
+        return value
+
+    def flush(self) -> None:
+        # write keys not yet persisted by the store
+        if self.store is not None:
+            self.store.flush()
+
+    def stop(self) -> None:
+        # flush, and stop the background work of the store
+        if self.store is not None:
+            self.store.stop()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {'size': len(self.entries), 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
@@ -1,7 +1,11 @@
+import asyncio
+import heapq
 import re
 
-from fuzzywuzzy import fuzz
+import numpy as np
+from rapidfuzz import (fuzz, process)
 
+from core.engine.answer_cache import AnswerCache
 from core.parsers import (MessageParser as _MessageParser, TextParser as _TextParser, nlp)
 
 
@@ -14,16 +18,19 @@ class MessageEngine:
     MAX_SENT_PER_GRP = 5
     MAX_GRP_PER_ANS = 15
     FUZZ_ACCEPT_RATIO = 80
-    HEADING_ACCEPT_SCORE = 80
-    MIN_ACCEPTABLE_SCORE = 20
     RE_ALPHANUMERIC = re.compile(r'[^A-Za-z0-9]')
+    RE_NON_WORD = re.compile(r'(?ui)\W')
+    ASCII_TRANSLATION = dict.fromkeys(range(128, 256))
     DEFAULT_FEEDBACK = "Sorry, I don't know the answer for that."
 
-    def __init__(self, api, frame_dict) -> None:
+    def __init__(self, api, frame_dict, answer_cache: AnswerCache = None) -> None:
         super().__init__()
         self.msg_parser = _MessageParser()
         self.frame_dict = frame_dict
         self.api = api
+        self.answer_cache = answer_cache
+        # precomputed heading text -> (content length, entities, frames, important tokens), loaded by App.load_indexes
+        self.heading_features = {}
 
     @staticmethod
     def __merge_adjacent_sent_ids(s: set, first: int, last: int) -> next:
@@ -42,79 +49,168 @@ class MessageEngine:
                 yield from range(e + 1, min([e + MessageEngine.MAX_SENT_PER_GRP, last + 1]))
 
     @staticmethod
-    def __extract_heading_data(headings: list, frame_dict: dict) -> next:
+    def extract_heading_features(heading: str, frame_dict: dict) -> tuple:
+        """
+    Extract the features of one heading level that are used for scoring. Heading text only changes when the KB is
+    populated, so these are precomputed by app_tasks.populate_heading_features
+        :param heading: heading text (one level of the heading hierarchy)
+        :param frame_dict: frame cache
+        :return: tuple of (alphanumeric content length, entities, frames, important tokens)
+        """
+        # assuming only one sentence
+        # parametrized heading, normalized entity dictionary
+        _entities = set([])
+        _frames = set([])
+        for pos_tags in _TextParser.generate_pos_tag_sets(heading):
+            pos_tags = list(pos_tags)
+            _entities.update(_TextParser.extract_entities(pos_tags))
+            _frames.update(_TextParser.get_frames(pos_tags, frame_dict))
+        _content_length = len(MessageEngine.RE_ALPHANUMERIC.sub('', heading))
+        return (_content_length, _entities, _frames, _TextParser.extract_important_tokens(heading))
+
+    @staticmethod
+    def __extract_heading_data(headings: list, frame_dict: dict, heading_features: dict) -> next:
         # assign headings as a 2D list of entities extracted from headings
         for _heading in headings:
-            # assuming only one sentence
-            # parametrized heading, normalized entity dictionary
-            _entities = set([])
-            _frames = set([])
-            for pos_tags in _TextParser.generate_pos_tag_sets(_heading):
-                pos_tags = list(pos_tags)
-                _entities.update(_TextParser.extract_entities(pos_tags))
-                _frames.update(_TextParser.get_frames(pos_tags, frame_dict))
+            # use the precomputed features if available, and only tag the heading on a miss
+            _features = heading_features.get(_heading)
+            if _features is None:
+                _features = MessageEngine.extract_heading_features(_heading, frame_dict)
             # add entities and content length to heading_entities as LIFO
-            _content_length = len(MessageEngine.RE_ALPHANUMERIC.sub('', _heading))
-            yield (_heading, _content_length, _entities, _frames)
+            yield (_heading,) + tuple(_features)
 
     @staticmethod
-    def __get_heading_score(heading_string: str, question_string: str, q_entities: set, q_frames: set,
-                            frame_dict: dict) -> float:
-        _score = 0
-        # edge cases
+    def __extract_heading_levels(heading_strings: list, frame_dict: dict, heading_features: dict) -> list:
+        """
+    Extract the data of every level of every heading (see __extract_heading_data), lowest level first. Levels
+    shared by several headings (i.e. a common parent) are only extracted once
+        :return: list of heading level lists, in the order of heading_strings
+        """
+        _data = {}
+        heading_levels = []
+        for heading_string in heading_strings:
+            _headings = heading_string.split(' > ')[::-1]
+            _missing = [_heading for _heading in dict.fromkeys(_headings) if _heading not in _data]
+            for _level in MessageEngine.__extract_heading_data(_missing, frame_dict, heading_features):
+                _data[_level[0]] = _level
+            heading_levels += [[_data[_heading] for _heading in _headings]]
+        return heading_levels
+
+    @staticmethod
+    def __get_score_bounds(heading_levels: list, q_entities: set, q_frames: set) -> list:
+        """
+    Upper bounds of the heading scores computed by __score_headings, without any fuzzy matching. The entity hit
+    ratio of a heading level is at most 100 and its coherence at most 1, so a heading scores at most the sum of
+    100 * frame hit ratio * depth weight over its levels with entities
+        :param heading_levels: list of heading level lists, as returned by __extract_heading_levels
+        :return: list of score upper bounds, in the order of heading_levels
+        """
         if len(q_entities) == 0:
-            return _score
-        # get the heading entities and verbs and print it
-        _heading_data = MessageEngine.__extract_heading_data(heading_string.split(' > ')[::-1], frame_dict)
-        # calculate entity matching score for entities in each heading
-        for h_index, (h_string, h_length, h_entities, h_frames) in enumerate(_heading_data):
-            # edge cases
-            if len(h_entities) == 0:
-                continue
-            # match entities and frames of current heading against question entities and frames
-            q_frame_hits = len(q_frames.intersection(h_frames))
-            q_entity_hit_ratio = 0
-            q_entity_hits = 0
-            # logic
-            for q_entity in q_entities:
-                # becomes true if question entity found within heading entities
-                # iterate through heading entities for each question entity
-                for h_entity in h_entities:
-                    # calculate the match ratio
-                    _ratio = fuzz.token_set_ratio(h_entity, q_entity, full_process=True)
-                    # if ratio is greater than the accept ratio, increment q_entity_hits and q_entity_hit_ratio
-                    if _ratio >= MessageEngine.FUZZ_ACCEPT_RATIO:
-                        q_entity_hit_ratio += _ratio
-                        q_entity_hits += 1
-                        # If a match for one q_entity found, consider it found and skip duplicates
-                        break
-
-            # ratio between [#of q_entities found in current heading] and the [total #of q_entities]
-            _entity_hit_ratio = (q_entity_hit_ratio / q_entity_hits) if q_entity_hits > 0 else 0
-            # ratio between [#of common frame count] and [#of question frames]
-            _frame_hit_ratio = (q_frame_hits / len(q_frames)) if len(q_frames) > 0 else 1
-            # raw match score for important tokens using SequenceMatcher
-            _coherence = fuzz.token_sort_ratio(
-                _TextParser.extract_important_tokens(heading_string),
-                _TextParser.extract_important_tokens(question_string)
-            ) / 100
-            # when going to parent headings, dept_weight decreases in square proportion
-            _depth_weight = 1 / ((h_index + 1) ** 2)
-            # calculate a score for current heading and add to total score
-            _weighted_score = _entity_hit_ratio * _frame_hit_ratio * _coherence * _depth_weight
-            # add weighted score to total score
-            _score += _weighted_score
-            print((heading_string, question_string, _entity_hit_ratio, _frame_hit_ratio, _coherence, _weighted_score))
-        return _score
+            return [0] * len(heading_levels)
+        bounds = []
+        for _levels in heading_levels:
+            _bound = 0
+            for h_index, (_, _, h_entities, h_frames, _) in enumerate(_levels):
+                if len(h_entities) == 0:
+                    continue
+                _frame_hit_ratio = (len(q_frames.intersection(h_frames)) / len(q_frames)) if len(q_frames) > 0 else 1
+                _bound += 100 * _frame_hit_ratio * (1 / ((h_index + 1) ** 2))
+            bounds += [_bound]
+        return bounds
+
+    @staticmethod
+    def __fuzz_process(text: str) -> str:
+        # same preprocessing as fuzzywuzzy's full_process (force_ascii=True), which the scores were tuned with
+        return MessageEngine.RE_NON_WORD.sub(' ', text.translate(MessageEngine.ASCII_TRANSLATION)).lower().strip()
+
+    @staticmethod
+    def __score_headings(heading_levels: list, question_string: str, q_entities: set, q_frames: set) -> list:
+        """
+    Score a batch of headings against a question. For each heading level, the entity hit ratio (average fuzzy ratio
+    of question entities matching a heading entity), the frame hit ratio and the coherence of the heading with the
+    question are multiplied, weighted by depth, and summed. The fuzzy ratios of all (heading entity, question entity)
+    pairs, and the coherence of all headings, are computed with one rapidfuzz cdist call each
+        :param heading_levels: list of heading level lists, as returned by __extract_heading_levels
+        :param question_string: input question
+        :param q_entities: entities of the question
+        :param q_frames: frames of the question
+        :return: list of heading scores, in the order of heading_levels
+        """
+        # edge cases
+        if len(q_entities) == 0 or len(heading_levels) == 0:
+            return [0] * len(heading_levels)
+        # get the heading entities and frames of every level of every heading
+        # each heading level with entities is flattened into a run of heading entity columns
+        _heading_tokens = []
+        _entity_columns = {}
+        _columns = []
+        _level_starts = []
+        _level_headings = []
+        _frame_hit_ratios = []
+        _depth_weights = []
+        for i, _levels in enumerate(heading_levels):
+            # important tokens of the whole heading are the union of the important tokens of each level (and the
+            # separator)
+            _tokens = set(token for (_, _, _, _, h_tokens) in _levels for token in h_tokens.split())
+            if len(_levels) > 1:
+                _tokens.add('>')
+            _heading_tokens += [' '.join(sorted(_tokens))]
+            for h_index, (_, _, h_entities, h_frames, _) in enumerate(_levels):
+                # edge cases
+                if len(h_entities) == 0:
+                    continue
+                _level_starts += [len(_columns)]
+                _level_headings += [i]
+                _columns += [_entity_columns.setdefault(h_entity, len(_entity_columns)) for h_entity in h_entities]
+                # ratio between [#of common frame count] and [#of question frames]
+                _frame_hit_ratios += [(len(q_frames.intersection(h_frames)) / len(q_frames)) if len(q_frames) > 0
+                                      else 1]
+                # when going to parent headings, dept_weight decreases in square proportion
+                _depth_weights += [1 / ((h_index + 1) ** 2)]
+        if len(_columns) == 0:
+            return [0] * len(heading_levels)
+
+        # fuzzy ratios of every (question entity, heading entity) pair, rounded like fuzzywuzzy ratios
+        _q_entities = [MessageEngine.__fuzz_process(q_entity) for q_entity in q_entities]
+        _h_entities = [MessageEngine.__fuzz_process(h_entity) for h_entity in _entity_columns]
+        _ratios = np.rint(process.cdist(_q_entities, _h_entities, scorer=fuzz.token_set_ratio, dtype=np.float64))
+        # raw match score for important tokens of each heading and the question
+        _question_tokens = MessageEngine.__fuzz_process(_TextParser.extract_important_tokens(question_string))
+        _coherences = np.rint(process.cdist([_question_tokens],
+                                            [MessageEngine.__fuzz_process(tokens) for tokens in _heading_tokens],
+                                            scorer=fuzz.token_sort_ratio, dtype=np.float64))[0] / 100
+
+        # for each question entity, keep the ratio of the first heading entity of each level above the accept ratio
+        _ratios = _ratios[:, _columns]
+        _hits = _ratios >= MessageEngine.FUZZ_ACCEPT_RATIO
+        _hit_counts = np.cumsum(_hits, axis=1)
+        _level_starts = np.array(_level_starts)
+        # hits of each question entity before the start of each level
+        _level_offsets = np.concatenate((np.zeros((len(_q_entities), 1)), _hit_counts[:, :-1]), axis=1)
+        _level_offsets = _level_offsets[:, _level_starts]
+        _level_lengths = np.diff(np.append(_level_starts, len(_columns)))
+        _first_hits = _hits & (_hit_counts - np.repeat(_level_offsets, _level_lengths, axis=1) == 1)
+        q_entity_hit_ratio = np.add.reduceat(_ratios * _first_hits, _level_starts, axis=1).sum(axis=0)
+        q_entity_hits = np.add.reduceat(_first_hits.astype(np.int64), _level_starts, axis=1).sum(axis=0)
+        # ratio between [#of q_entities found in current heading] and the [total #of q_entities]
+        _entity_hit_ratios = np.divide(q_entity_hit_ratio, q_entity_hits, out=np.zeros(len(_level_starts)),
+                                       where=q_entity_hits > 0)
+        # calculate a score for each heading level, and add up the levels of each heading
+        _level_headings = np.array(_level_headings)
+        _weighted_scores = _entity_hit_ratios * np.array(_frame_hit_ratios) * _coherences[_level_headings] * \
+            np.array(_depth_weights)
+        return np.bincount(_level_headings, weights=_weighted_scores, minlength=len(heading_levels)).tolist()
 
     @staticmethod
     def __expand_entities(src_entities: set) -> dict:
         return {x: list(nlp.get_ngrams(x)) for x in src_entities}
 
-    def process_and_answer(self, q_string: str) -> next:
+    def process_and_answer(self, q_string: str, stream: bool = False) -> next:
         """
     Extract the semantic meaning of a question, and produce a valid list of outputs with a relevance score
         :param q_string: input question
+        :param stream: if true, the top answer is fetched and yielded before the sentences of the other answers are
+        fetched (at the cost of one more query), so that it can be sent as soon as possible
         :return: output answer
         :rtype: next
         """
@@ -126,83 +222,154 @@ class MessageEngine:
             # get entities frames, and question score from sentence
             q_entities = _TextParser.extract_entities(pos_tags)
             q_frames = _TextParser.get_frames(pos_tags, self.frame_dict)
-            q_entities_enhanced = MessageEngine.__expand_entities(q_entities)
             # q_score = self.msg_parser.calculate_score(parsed_string)
 
-            # query for matches in database
-            print(q_entities_enhanced)
-            grouped_sent_id_matches = self.api.query_sentence_ids(q_entities_enhanced, q_frames)
+            # questions with the same entities, frames and important tokens share their answers
+            if self.answer_cache is None:
+                yield from self.__answer(q_string, q_entities, q_frames, stream)
+                continue
+            key = MessageEngine.__get_cache_key(q_string, q_entities, q_frames)
+            answers = self.answer_cache.get(key)
+            if answers is not None:
+                yield from answers
+                continue
+            answers = []
+            generation = self.answer_cache.generation
+            for answer in self.__answer(q_string, q_entities, q_frames, stream):
+                answers += [answer]
+                yield answer
+            self.answer_cache.put(key, answers, generation)
 
-            # if no matches found, return the default fallback
-            if len(grouped_sent_id_matches) == 0:
-                yield (None, '', 0, MessageEngine.DEFAULT_FEEDBACK)
+    async def process_and_answer_async(self, q_string: str, api, stream: bool = False) -> next:
+        """
+    Same as process_and_answer, but pos-tags the question and queries the KB without blocking the event loop
+        :param q_string: input question
+        :param api: AsyncPostgresAPI to query the KB with
+        :param stream: if true, the top answer is fetched and yielded first (see process_and_answer)
+        :return: async generator of (heading, url, score, answer)
+        """
+        for pos_tags in await _TextParser.generate_pos_tag_sets_async(q_string.strip('?.,:\n')):
+            # get entities frames, and question score from sentence
+            q_entities = _TextParser.extract_entities(pos_tags)
+            # frames missing from the frame cache are looked up in MongoDB and FrameNet, so extract them in a thread
+            q_frames = await asyncio.get_event_loop().run_in_executor(None, _TextParser.get_frames, pos_tags,
+                                                                      self.frame_dict)
 
-            else:
-                # group sets of sentences under headings, and sort by descending order of heading score
-                best_matches = []
-                good_matches = []
-                indirect_matches = []
-                print('Rating Answers...')
-                heading_info = self.api.get_heading_info_by_ids(grouped_sent_id_matches.keys())
-                for h_id in grouped_sent_id_matches:
-                    sent_ids = grouped_sent_id_matches[h_id]
-                    h_string, min_id, max_id = heading_info[h_id]
-                    match = [
-                        h_id,
-                        h_string,
-                        self.__get_heading_score(h_string, q_string, q_entities, q_frames, self.frame_dict),
-                        self.__merge_adjacent_sent_ids(sent_ids, min_id, max_id)
-                    ]
-                    # Add to good matches set or other matches set depending on heading score
-                    if match[2] >= MessageEngine.HEADING_ACCEPT_SCORE:
-                        best_matches += [match]
-                    elif match[2] >= MessageEngine.MIN_ACCEPTABLE_SCORE:
-                        good_matches += [match]
-                    else:
-                        indirect_matches += [match]
-                    if len(best_matches) >= MessageEngine.MAX_GRP_PER_ANS:
-                        print('Enough good matches found. Stopping iteration...')
-                        break
-                print('Rating Completed!')
-
-                remaining = MessageEngine.MAX_GRP_PER_ANS
-
-                # Yielding best matches
-                best_matches.sort(key=lambda item: item[2], reverse=True)
-                for (h_id, heading, h_score, s_ids) in best_matches[:remaining]:
-                    answers = [
-                        _TextParser.extract_sentence(pos_tags, preserve_entities=True)
-                        for index, (sent_id, pos_tags) in enumerate(self.api.get_sentences_by_id(s_ids))
-                        if index < MessageEngine.MAX_SENT_PER_GRP
-                    ]
-                    yield (heading, get_reference_url(h_id), h_score, ' '.join(answers))
-
-                remaining -= len(best_matches)
-                if not remaining > 0:
-                    continue
+            # questions with the same entities, frames and important tokens share their answers
+            key = MessageEngine.__get_cache_key(q_string, q_entities, q_frames)
+            answers = self.answer_cache.get(key) if self.answer_cache is not None else None
+            if answers is not None:
+                for answer in answers:
+                    yield answer
+                continue
+            answers = []
+            generation = self.answer_cache.generation if self.answer_cache is not None else None
+            async for answer in self.__answer_async(api, q_string, q_entities, q_frames, stream):
+                answers += [answer]
+                yield answer
+            if self.answer_cache is not None:
+                self.answer_cache.put(key, answers, generation)
 
-                # Yielding good matches
-                good_matches.sort(key=lambda item: item[2], reverse=True)
-                # Merge nearby sentences and yield merged_matches
-                for (h_id, heading, h_score, s_ids) in good_matches[:remaining]:
-                    answers = [
-                        _TextParser.extract_sentence(pos_tags, preserve_entities=True)
-                        for index, (sent_id, pos_tags) in enumerate(self.api.get_sentences_by_id(s_ids))
-                        if index < MessageEngine.MAX_SENT_PER_GRP
-                    ]
-                    yield (heading, get_reference_url(h_id), h_score, ' '.join(answers))
-
-                remaining -= len(good_matches)
-                if not remaining > 0:
-                    continue
+    @staticmethod
+    def __get_cache_key(q_string: str, q_entities: set, q_frames: set) -> tuple:
+        return tuple(sorted(q_entities)), tuple(sorted(q_frames)), _TextParser.extract_important_tokens(q_string)
+
+    @staticmethod
+    def __get_fetch_batches(selected: list, stream: bool) -> list:
+        # the sentences of all selected groups are fetched in one query. groups are only scored once all of them are,
+        # so when streaming, the top group is fetched on its own first, and sent while the others are fetched
+        if stream and len(selected) > 1:
+            return [selected[:1], selected[1:]]
+        return [selected]
 
-                # Yielding indirect matches
-                indirect_matches.sort(key=lambda item: item[2], reverse=True)
-                # Merge nearby sentences and yield merged_matches
-                for (h_id, heading, h_score, s_ids) in indirect_matches[:remaining]:
-                    answers = [
-                        _TextParser.extract_sentence(pos_tags, preserve_entities=True)
-                        for index, (sent_id, pos_tags) in enumerate(self.api.get_sentences_by_id(s_ids))
-                        if index < MessageEngine.MAX_SENT_PER_GRP
-                    ]
-                    yield (heading, get_reference_url(h_id), h_score, ' '.join(answers))
+    def __answer(self, q_string: str, q_entities: set, q_frames: set, stream: bool = False) -> next:
+        """
+    Answer one sentence of a question, given its entities and frames
+        :param q_string: input question
+        :param q_entities: entities of the question sentence
+        :param q_frames: frames of the question sentence
+        :param stream: whether to fetch and yield the top group first
+        :return: generator of (heading, url, score, answer)
+        """
+        q_entities_enhanced = MessageEngine.__expand_entities(q_entities)
+        # query for matches in database
+        print(q_entities_enhanced)
+        grouped_sent_id_matches = self.api.query_sentence_ids(q_entities_enhanced, q_frames)
+
+        # if no matches found, return the default fallback
+        if len(grouped_sent_id_matches) == 0:
+            yield (None, '', 0, MessageEngine.DEFAULT_FEEDBACK)
+
+        else:
+            heading_info = self.api.get_heading_info_by_ids(grouped_sent_id_matches.keys())
+            selected = self.__select_groups(q_string, q_entities, q_frames, grouped_sent_id_matches, heading_info)
+            # fetch the sentences of the selected groups in as few queries as possible, and yield the groups in order
+            for batch in MessageEngine.__get_fetch_batches(selected, stream):
+                sentences = self.api.get_sentences_by_ids([s_id for (_, _, _, s_ids) in batch for s_id in s_ids])
+                yield from MessageEngine.__format_groups(batch, sentences)
+
+    async def __answer_async(self, api, q_string: str, q_entities: set, q_frames: set, stream: bool = False) -> next:
+        # same as __answer, querying the KB through an AsyncPostgresAPI
+        grouped_sent_id_matches = await api.query_sentence_ids(MessageEngine.__expand_entities(q_entities), q_frames)
+
+        # if no matches found, return the default fallback
+        if len(grouped_sent_id_matches) == 0:
+            yield (None, '', 0, MessageEngine.DEFAULT_FEEDBACK)
+
+        else:
+            heading_info = await api.get_heading_info_by_ids(grouped_sent_id_matches.keys())
+            # scoring may pos-tag headings and extract their frames, so select the groups in a thread
+            selected = await asyncio.get_event_loop().run_in_executor(
+                None, self.__select_groups, q_string, q_entities, q_frames, grouped_sent_id_matches, heading_info)
+            for batch in MessageEngine.__get_fetch_batches(selected, stream):
+                sentences = await api.get_sentences_by_ids([s_id for (_, _, _, s_ids) in batch for s_id in s_ids])
+                for answer in MessageEngine.__format_groups(batch, sentences):
+                    yield answer
+
+    def __select_groups(self, q_string: str, q_entities: set, q_frames: set, grouped_sent_id_matches: dict,
+                        heading_info: dict) -> list:
+        """
+    Score the matched heading groups and pick the best MAX_GRP_PER_ANS of them
+        :return: list of (heading id, heading, score, sentence ids), in descending order of score
+        """
+        print('Rating Answers...')
+        h_ids = list(grouped_sent_id_matches.keys())
+        h_strings = [heading_info[h_id][0] for h_id in h_ids]
+        # score candidates in descending order of their score upper bound, in batches, and keep the top k in a
+        # min-heap of (score, -index). stop when the next bound cannot beat the lowest score of a full heap
+        # the levels of each heading are extracted once, and shared by the bounds and the scores
+        h_levels = self.__extract_heading_levels(h_strings, self.frame_dict, self.heading_features)
+        bounds = self.__get_score_bounds(h_levels, q_entities, q_frames)
+        order = sorted(range(len(h_ids)), key=lambda i: bounds[i], reverse=True)
+        top_k = []
+        for start in range(0, len(order), MessageEngine.MAX_GRP_PER_ANS):
+            if len(top_k) == MessageEngine.MAX_GRP_PER_ANS and bounds[order[start]] <= top_k[0][0]:
+                print('No remaining heading can enter the top matches. Stopping iteration...')
+                break
+            batch = order[start:start + MessageEngine.MAX_GRP_PER_ANS]
+            h_scores = self.__score_headings([h_levels[i] for i in batch], q_string, q_entities, q_frames)
+            for i, h_score in zip(batch, h_scores):
+                if len(top_k) < MessageEngine.MAX_GRP_PER_ANS:
+                    heapq.heappush(top_k, (h_score, -i))
+                elif (h_score, -i) > top_k[0]:
+                    heapq.heapreplace(top_k, (h_score, -i))
+        print('Rating Completed!')
+
+        # pick the answer groups in descending order of heading score
+        selected = []
+        for h_score, i in sorted(top_k, reverse=True):
+            h_id = h_ids[-i]
+            h_string, min_id, max_id = heading_info[h_id]
+            s_ids = list(self.__merge_adjacent_sent_ids(grouped_sent_id_matches[h_id], min_id, max_id))
+            selected += [(h_id, h_string, h_score, s_ids)]
+        return selected
+
+    @staticmethod
+    def __format_groups(selected: list, sentences: dict) -> next:
+        # yield each selected group with the first MAX_SENT_PER_GRP of its sentences that exist
+        for (h_id, heading, h_score, s_ids) in selected:
+            answers = [
+                _TextParser.extract_sentence(sentences[s_id], preserve_entities=True)
+                for s_id in [s_id for s_id in s_ids if s_id in sentences][:MessageEngine.MAX_SENT_PER_GRP]
+            ]
+            yield (heading, get_reference_url(h_id), h_score, ' '.join(answers))
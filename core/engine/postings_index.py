@@ -0,0 +1,67 @@
+from array import array
+from heapq import merge
+
+
+class PostingsIndex:
+    """
+In-memory inverted index of the KB normalizations: entity id -> sorted sentence ids, and sentence id -> heading id.
+Answers the "all question entities present under one heading" check of PostgresAPI.query_sentence_ids without
+aggregating the normalizations table
+    """
+
+    def __init__(self, postings: list, sentence_headings: list) -> None:
+        """
+        :param postings: list of (entity_id, sentence_ids) rows, as returned by PostgresAPI.get_entity_postings
+        :param sentence_headings: list of (sentence_id, heading_id) rows, as returned by
+        PostgresAPI.get_sentence_headings
+        """
+        super().__init__()
+        # sentence ids are dense, so the sentence -> heading map is stored as an array indexed by sentence id
+        self.headings = array('i', [0] * (max((int(s_id) for s_id, h_id in sentence_headings), default=0) + 1))
+        for sentence_id, heading_id in sentence_headings:
+            self.headings[int(sentence_id)] = int(heading_id)
+        # sentences without a heading (i.e. added after the headings were loaded) are left out of the postings
+        size = len(self.headings)
+        self.postings = {int(entity_id): array('i', sorted(s_id for s_id in sentence_ids if s_id < size))
+                         for entity_id, sentence_ids in postings}
+
+    def __len__(self) -> int:
+        return len(self.postings)
+
+    def get_sentence_ids(self, entity_ids: list) -> list:
+        """
+    Merge the postings of the given entities
+        :param entity_ids: list of entity ids
+        :return: sorted list of distinct sentence ids containing any of the entities
+        """
+        result = []
+        for sentence_id in merge(*(self.postings.get(entity_id, ()) for entity_id in set(entity_ids))):
+            if len(result) == 0 or result[-1] != sentence_id:
+                result.append(sentence_id)
+        return result
+
+    def match_headings(self, entity_groups: list) -> dict:
+        """
+    Find headings containing at least one entity of every group, along with the sentences under them that contain
+    an entity of any group
+        :param entity_groups: list of entity id lists (one list per question entity)
+        :return: dict of heading id -> sorted list of sentence ids
+        """
+        if len(entity_groups) == 0:
+            return {}
+        sentence_groups = [self.get_sentence_ids(entity_ids) for entity_ids in entity_groups]
+        # intersect the headings of each group, starting from the smallest group
+        common_headings = None
+        for sentence_ids in sorted(sentence_groups, key=len):
+            group_headings = set(self.headings[sentence_id] for sentence_id in sentence_ids)
+            common_headings = group_headings if common_headings is None else common_headings & group_headings
+            if len(common_headings) == 0:
+                return {}
+        result = {}
+        previous = None
+        for sentence_id in merge(*sentence_groups):
+            heading_id = self.headings[sentence_id]
+            if sentence_id != previous and heading_id in common_headings:
+                result.setdefault(heading_id, []).append(sentence_id)
+            previous = sentence_id
+        return result
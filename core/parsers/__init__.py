@@ -1,4 +1,6 @@
 import core.parsers.nlp
+from core.parsers.frame_index import FrameIndex
 from core.parsers.markdown_parser import MarkdownParser
 from core.parsers.msg_parser import MessageParser
+from core.parsers.stopword_service import StopwordService
 from core.parsers.txt_parser import TextParser
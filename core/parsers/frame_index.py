@@ -0,0 +1,151 @@
+import os
+import pickle
+import re
+import string
+import tempfile
+from functools import lru_cache
+from threading import Lock
+
+from nltk.corpus import framenet as fn
+
+INDEX_PATH = './lib/framenet_lu_index.pickle'
+INDEX_VERSION = 1
+RE_LU_QUERY = r'(?i)(^|\s)(%s)(\s.+)?\.%s'
+RE_PLAIN_WORD = re.compile(r'[a-z ]*')
+WORDNET_POS = ('a', 'n', 'r', 'v')
+
+FRAME_INDEX = None
+FRAME_INDEX_LOCK = Lock()
+
+
+@lru_cache(maxsize=None)
+def fold_case(c: str) -> str:
+    # the ascii letter a character matches in a case-insensitive regex (i.e. 'K' for the kelvin sign), or itself
+    if ord(c) < 128:
+        return c.lower()
+    for letter in string.ascii_lowercase:
+        if re.match('(?i)' + letter, c):
+            return letter
+    return c
+
+
+class FrameIndex:
+    """
+Precompiled index of the FrameNet lexical units: (word, wordnet pos) -> sorted frame names. A lookup gives the same
+frames as searching the LU names with the regex (?i)(^|\\s)(word)(\\s.+)?\\.pos (so '.a' also matches '.adv', and
+a word may be any token, or run of tokens, of a multi-word LU), without scanning the LUs
+    """
+
+    def __init__(self, index: dict) -> None:
+        """
+        :param index: dict of (word, pos) -> sorted list of frame names
+        """
+        super().__init__()
+        self.index = index
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    @staticmethod
+    def match_keys(lu_name: str, pos_list: tuple = WORDNET_POS) -> next:
+        """
+    Find the (word, pos) pairs whose LU regex matches an LU name
+        :param lu_name: name of the lexical unit (i.e. 'give up.v')
+        :param pos_list: wordnet pos tags to match
+        :return: generator of (word, pos) tuples. a pair may be yielded more than once
+        """
+        # lowercase character by character, so that positions stay aligned with the name
+        name = ''.join(fold_case(c) for c in lu_name)
+        for i in range(len(name)):
+            # the word starts at the beginning of the name, or after whitespace
+            if i > 0 and not name[i - 1].isspace():
+                continue
+            # the word ends before a '.' (followed by the pos) or whitespace (followed by '.pos' later on), and
+            # never contains a '.'
+            for j in range(i, len(name)):
+                c = name[j]
+                if c == '.':
+                    for pos in pos_list:
+                        if name.startswith(pos, j + 1):
+                            yield name[i:j], pos
+                    break
+                if c.isspace():
+                    for pos in pos_list:
+                        k = name.find('.' + pos, j + 2)
+                        if k != -1 and '\n' not in name[j + 1:k]:
+                            yield name[i:j], pos
+
+    @staticmethod
+    def build() -> 'FrameIndex':
+        """
+    Build the index from all FrameNet lexical units (the ones fn.lus() searches)
+        """
+        index = {}
+        for lu_id, lu_name in fn.lu_ids_and_names().items():
+            frame_name = fn.lu(lu_id).frame.name
+            for key in FrameIndex.match_keys(lu_name):
+                index.setdefault(key, set()).add(frame_name)
+        return FrameIndex({key: sorted(frames) for key, frames in index.items()})
+
+    @staticmethod
+    def load(path: str = INDEX_PATH) -> 'FrameIndex':
+        """
+    Load the index from disk, building (and saving) it first if it does not exist, is outdated or is unreadable
+        :param path: path of the serialized index
+        """
+        if os.path.exists(path):
+            try:
+                with open(path, 'rb') as f:
+                    data = pickle.load(f)
+                if data.get('version') == INDEX_VERSION:
+                    return FrameIndex(data['index'])
+            except (pickle.UnpicklingError, EOFError, AttributeError, ValueError) as ex:
+                print('Rebuilding the FrameNet LU index (%s)' % ex)
+        frame_index = FrameIndex.build()
+        frame_index.save(path)
+        return frame_index
+
+    def save(self, path: str = INDEX_PATH) -> None:
+        directory = os.path.dirname(path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        # write to a temporary file of this process first, so that neither a concurrent load nor a concurrent save
+        # (i.e. by other workers building the index at the same time) sees a partial index
+        with tempfile.NamedTemporaryFile(dir=directory, prefix=os.path.basename(path) + '.', suffix='.tmp',
+                                         delete=False) as f:
+            try:
+                pickle.dump({'version': INDEX_VERSION, 'index': self.index}, f, pickle.HIGHEST_PROTOCOL)
+            except Exception:
+                f.close()
+                os.remove(f.name)
+                raise
+        os.replace(f.name, path)
+
+    def get_frames(self, word: str, pos: str) -> list:
+        """
+    Get the frames of the lexical units matching a word and pos
+        :param word: normalized word (lowercase letters and spaces)
+        :param pos: wordnet pos tag
+        :return: sorted list of frame names
+        """
+        word = word.lower()
+        pos = pos.lower()
+        if pos in WORDNET_POS and RE_PLAIN_WORD.fullmatch(word) is not None:
+            return list(self.index.get((word, pos), ()))
+        # words and pos tags the index was not built for are matched against the LUs directly
+        return sorted(set(lu.frame.name for lu in fn.lus(RE_LU_QUERY % (word, pos))))
+
+
+def get_frame_index() -> FrameIndex:
+    # the index is loaded (or built) once, on first use
+    global FRAME_INDEX
+    if FRAME_INDEX is None:
+        with FRAME_INDEX_LOCK:
+            if FRAME_INDEX is None:
+                FRAME_INDEX = FrameIndex.load()
+    return FRAME_INDEX
+
+
+if __name__ == "__main__":
+    # (re)build the index, i.e. after updating the FrameNet corpus
+    FrameIndex.build().save()
+    print('FrameNet LU index saved to %s' % INDEX_PATH)
@@ -1,21 +1,24 @@
 import re
 from collections import Generator
+from functools import lru_cache
 
 from nltk import ngrams
 from nltk.corpus import wordnet
 from nltk.stem import WordNetLemmatizer
 
-from core.api import StanfordAPI
+from core.parsers import taggers
 
 # Constants for reuse
 ALNUM_THRESHOLD = 0.5
 ENTITY_PLACEHOLDER = 'ENTITY'
+LEMMA_CACHE_SIZE = 65536
 LIST_JUNK = (r'[ie](\s|\.)+[eg](\s|\.|$)+', r'etc(\s|\.|$)+')
 MAX_ENTITY_LENGTH = 100
 MIN_ENTITY_LENGTH = 2
 MAX_LEAF_LENGTH = 25
 MIN_LEAF_LENGTH = 2
 MIN_SENT_LENGTH = 4
+NORMALIZE_CACHE_SIZE = 65536
 RE_PLURAL_DROP = re.compile(r'(?<=[A-Ze])(s)$')
 RE_PLURAL_Y = re.compile(r'(?<=[A-Za-z])(ies)$')
 RE_BRACKETS = re.compile(r'\s*-[LR][CSR]B-\s*')
@@ -30,19 +33,31 @@ RE_RIGHTMOST_WORD = re.compile(r'(?<=\s)(\w+)$')
 RE_SENT_TOKENIZE = re.compile(r'.+?(?<=[A-Za-z])[!.?;:]\s*(?=[A-Z]|$)|.+?$')
 RE_SPACES = re.compile(r'\s+')
 RE_WORD_TOKENIZE = re.compile(r'[^A-Za-z0-9]*\s+|\s*[^A-Za-z0-9]+|[^A-Za-z0-9]+\s*(?=$)|\s+[^A-Za-z0-9]*(?=$)')
-STANFORD_API = StanfordAPI()
+POS_TAGGER = taggers.StanfordTagger()
+LEMMATIZER = WordNetLemmatizer()
 
 
+@lru_cache(maxsize=LEMMA_CACHE_SIZE)
+def lemmatize_word(word: str, pos: str = wordnet.NOUN) -> str:
+    """
+Lemmatize a word using the shared WordNet lemmatizer. Results are cached, since the vocabulary repeats a lot
+    :param word: input word
+    :param pos: wordnet pos-tag of the word. default is noun
+    :return: lemma of the word
+    """
+    return LEMMATIZER.lemmatize(word, pos)
+
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
 def normalize_text(text: str, lemmatize: bool = True, ignore_num: bool = False) -> str:
     """
-Normalize the text into **lowercase**, **singular** form
+Normalize the text into **lowercase**, **singular** form. Results are cached
     :param text: input text
     :param lemmatize: default is True. If true, lemmatizes the last word of the text
     :param ignore_num: default is False. If true, ignores numerals completely
     :return: output string
     :rtype: str
     """
-    lemmatizer = WordNetLemmatizer()
     # remove plurals from entities
     text = RE_PLURAL_DROP.sub('', text)
     text = RE_PLURAL_Y.sub('y', text)
@@ -54,12 +69,12 @@ Normalize the text into **lowercase**, **singular** form
     rightmost_word = RE_RIGHTMOST_WORD.findall(text)
     # lemmatize and return entity if no rightmost words found
     if len(rightmost_word) == 0:
-        lemma = lemmatizer.lemmatize(text) if lemmatize else text
+        lemma = lemmatize_word(text) if lemmatize else text
         return RE_SPACES.sub('', lemma)
     # lemmatize the rightmost word and return new text
     else:
         rightmost_word = rightmost_word[-1]
-        lem_word = lemmatizer.lemmatize(rightmost_word) if lemmatize else rightmost_word
+        lem_word = lemmatize_word(rightmost_word) if lemmatize else rightmost_word
         text = text[::-1].replace(rightmost_word[::-1], lem_word[::-1], 1)[::-1]
         text = RE_SPACES.sub(' ', text.replace(rightmost_word, lem_word))
         return text
@@ -101,18 +116,56 @@ Transform **Penn-Treebank** POS tags to **Wordnet** POS Tags
         return ''
 
 
+def set_pos_tagger(backend: str, **options) -> taggers.POSTagger:
+    """
+Switch the POS tagging backend used by pos_tag and pos_tag_many
+    :param backend: name of the backend (see taggers.BACKENDS)
+    :param options: keyword arguments of the backend (see taggers.create_tagger)
+    :return: the new POS tagger
+    """
+    global POS_TAGGER
+    POS_TAGGER = taggers.create_tagger(backend, **options)
+    return POS_TAGGER
+
+
+def get_pos_tagger() -> taggers.POSTagger:
+    return POS_TAGGER
+
+
 def pos_tag(sentence: str, wordnet_pos=False) -> next:
     """
-POS-tag a sentence using Stanford pos-tagger, and return a list of pos_tagged tokens
+POS-tag a sentence using the active pos-tagger backend, and return a list of pos_tagged tokens
     :param sentence: the sentence to pos-tag
-    :param wordnet_pos: If true, return pos-tags in wordnet-format. Default is false (returns stanford pos-tag format)
+    :param wordnet_pos: If true, return pos-tags in wordnet-format. Default is false (returns penn-treebank format)
     """
     # yield triples depending on which pos-tag syntax is requested
-    for token, pos in STANFORD_API.pos_tag(sentence):
+    for token, pos in POS_TAGGER.pos_tag(sentence):
         # yield wordnet pos-tag or penn-treebank pos tags depending on choice
         yield [token, get_wordnet_pos(pos) if wordnet_pos else pos]
 
 
+def pos_tag_many(sentences: list, wordnet_pos=False) -> next:
+    """
+POS-tag a batch of sentences in one call to the active pos-tagger backend
+    :param sentences: list of sentences to pos-tag
+    :param wordnet_pos: If true, return pos-tags in wordnet-format. Default is false (returns penn-treebank format)
+    """
+    for pos_tags in POS_TAGGER.pos_tag_many(sentences):
+        yield [[token, get_wordnet_pos(pos) if wordnet_pos else pos] for token, pos in pos_tags]
+
+
+async def pos_tag_many_async(sentences: list, wordnet_pos=False) -> list:
+    """
+POS-tag a batch of sentences from an event loop (see pos_tag_many)
+    :param sentences: list of sentences to pos-tag
+    :param wordnet_pos: If true, return pos-tags in wordnet-format. Default is false (returns penn-treebank format)
+    """
+    return [
+        [[token, get_wordnet_pos(pos) if wordnet_pos else pos] for token, pos in pos_tags]
+        for pos_tags in await POS_TAGGER.pos_tag_many_async(sentences)
+    ]
+
+
 def sent_tokenize(in_str: str) -> Generator:
     """
 Accepts a string containing *multiple* sentences, and return a list of sentences.
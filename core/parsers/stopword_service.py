@@ -0,0 +1,36 @@
+import os
+from typing import Iterable
+
+from nltk.corpus import stopwords
+
+ENTITY_STOPWORDS_PATH = os.path.join(os.path.dirname(__file__), '..', '..', 'static', 'entity_stopwords.csv')
+
+
+class StopwordService:
+    """
+Stopword lookups against frozensets loaded once: the NLTK stopwords of a language, and those along with the entity
+stopwords of static/entity_stopwords.csv (one word per line)
+    """
+
+    def __init__(self, language: str = 'english', entity_stopwords_path: str = ENTITY_STOPWORDS_PATH) -> None:
+        super().__init__()
+        self.stopwords = frozenset(stopwords.words(language))
+        with open(entity_stopwords_path) as f:
+            self.entity_stopwords = self.stopwords | frozenset(line.strip().lower() for line in f if line.strip())
+
+    def is_stopword(self, word: str) -> bool:
+        return word in self.stopwords
+
+    def is_entity_stopword(self, word: str) -> bool:
+        return word in self.entity_stopwords
+
+    def filter_tokens(self, tokens: Iterable) -> list:
+        """
+    Drop the stopwords of a token array
+        :param tokens: tokens (lowercase)
+        :return: list of the remaining tokens, in order
+        """
+        return [token for token in tokens if token not in self.stopwords]
+
+
+STOPWORD_SERVICE = StopwordService()
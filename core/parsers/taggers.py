@@ -0,0 +1,97 @@
+import asyncio
+from abc import (ABC, abstractmethod)
+
+from core.api import (AsyncStanfordAPI, StanfordAPI)
+
+
+class POSTagger(ABC):
+    """
+Base class for POS tagging backends. Every backend accepts whitespace-tokenized sentences and emits
+**Penn-Treebank** pos-tags, which is what the chunk grammar in TextParser expects
+    """
+    # whether the backend needs the Stanford server (core.services.StanfordServer) to be running
+    requires_server = False
+
+    def pos_tag(self, sentence: str) -> list:
+        return self.pos_tag_many([sentence])[0]
+
+    @abstractmethod
+    def pos_tag_many(self, sentences: list) -> list:
+        """
+    POS-tag a batch of sentences
+        :param sentences: list of sentences
+        :return: list of (token, pos) lists, in the same order as the sentences
+        """
+
+    def close(self) -> None:
+        # release the resources of the backend (e.g. open connections)
+        pass
+
+    async def pos_tag_many_async(self, sentences: list) -> list:
+        """
+    POS-tag a batch of sentences from an event loop. In-process backends are run in the default executor, so that
+    the event loop is not blocked
+        :param sentences: list of sentences
+        :return: list of (token, pos) lists, in the same order as the sentences
+        """
+        return await asyncio.get_event_loop().run_in_executor(None, self.pos_tag_many, sentences)
+
+
+class StanfordTagger(POSTagger):
+    """
+POS-tag through the Stanford MaxentTaggerServer socket
+    """
+    requires_server = True
+
+    def __init__(self, api: StanfordAPI = None, port: int = 6000) -> None:
+        super().__init__()
+        self.api = api if api is not None else StanfordAPI(port=port)
+        self.async_api = None
+
+    def pos_tag_many(self, sentences: list) -> list:
+        return self.api.pos_tag_many(sentences)
+
+    def close(self) -> None:
+        self.api.close()
+
+    async def pos_tag_many_async(self, sentences: list) -> list:
+        # asyncio connections belong to an event loop, so the async client is only created when first used from one
+        if self.async_api is None:
+            self.async_api = AsyncStanfordAPI(port=self.api.port, timeout=self.api.timeout)
+        return await self.async_api.pos_tag_many(sentences)
+
+
+class PerceptronTagger(POSTagger):
+    """
+POS-tag in-process using the NLTK averaged perceptron. The model is loaded once, when the tagger is created
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        from nltk.tag.perceptron import PerceptronTagger as _PerceptronTagger
+        self.tagger = _PerceptronTagger()
+
+    def pos_tag_many(self, sentences: list) -> list:
+        # match the Stanford backend, which receives ascii-only text with tokenization disabled
+        return [
+            self.tagger.tag(sentence.strip().encode('ascii', 'ignore').decode('ascii').split())
+            for sentence in sentences
+        ]
+
+
+BACKENDS = {
+    'stanford': StanfordTagger,
+    'perceptron': PerceptronTagger,
+}
+
+
+def create_tagger(backend: str, **options) -> POSTagger:
+    """
+Create a POS tagger for the given backend name
+    :param backend: one of the keys of BACKENDS
+    :param options: keyword arguments of the backend (e.g. port of the Stanford server)
+    :return: POS tagger instance
+    """
+    if backend not in BACKENDS:
+        raise ValueError('Unknown pos-tagger backend: %s (expected one of %s)' % (backend, ', '.join(BACKENDS)))
+    return BACKENDS[backend](**options)
@@ -3,10 +3,10 @@ from collections import Iterable
 from difflib import SequenceMatcher
 
 from nltk import (RegexpParser, Tree, breadth_first)
-from nltk.corpus import (framenet as fn, stopwords)
-from nltk.stem import WordNetLemmatizer
 
 from core.parsers import nlp
+from core.parsers.frame_index import get_frame_index
+from core.parsers.stopword_service import STOPWORD_SERVICE
 
 GRAMMAR = '''           
 # Adjectives (Composite)
@@ -26,8 +26,6 @@ VP: {<.*>+}
 }<NP>+{
 '''
 PARSER = RegexpParser(GRAMMAR)
-LEMMATIZER = WordNetLemmatizer()
-STOPWORDS = stopwords.words('english')
 
 
 class TextParser:
@@ -38,14 +36,29 @@ class TextParser:
     @staticmethod
     def generate_pos_tag_sets(input_string: str) -> next:
         """
-    Break given string into sentences, and return their pos-tagged lists.\n
-    **REQUIRES AN ACTIVE POS TAGGER TO BE RUNNING!!**
+    Break given string into sentences, and return their pos-tagged lists. All sentences are tagged as one batch.\n
+    **REQUIRES AN ACTIVE POS TAGGER TO BE RUNNING!!** (the Stanford server, unless an in-process backend is set)
         :param input_string: input string. may contain one or more sentences
         """
-        return (list(nlp.pos_tag(sentence)) for sentence in nlp.sent_tokenize(input_string))
+        return nlp.pos_tag_many(list(nlp.sent_tokenize(input_string)))
 
     @staticmethod
-    def get_frames(pos_tags: Iterable, frame_cache: dict, verbose: bool = False) -> set:
+    async def generate_pos_tag_sets_async(input_string: str) -> list:
+        """
+    Break given string into sentences, and return their pos-tagged lists, without blocking the event loop
+        :param input_string: input string. may contain one or more sentences
+        """
+        return await nlp.pos_tag_many_async(list(nlp.sent_tokenize(input_string)))
+
+    @staticmethod
+    def get_frames(pos_tags: Iterable, frame_cache, verbose: bool = False) -> set:
+        """
+    Get the FrameNet frames of the tokens of a sentence
+        :param pos_tags: pos-tagged tokens
+        :param frame_cache: dict-like cache of word__pos key -> frames (i.e. core.engine.FrameCache), extended with
+        the keys looked up in FrameNet
+        :return: set of frames (and normalized tokens with no wordnet pos)
+        """
         results = set()
 
         # iterate through each token, and create a dict of token -> words
@@ -54,7 +67,7 @@ class TextParser:
             search_word = token.lower()
 
             # Ignore single-letter words and stopwords
-            if pos[0] == ['N'] or len(search_word) < 2 or search_word in STOPWORDS:
+            if pos[0] == ['N'] or len(search_word) < 2 or STOPWORD_SERVICE.is_stopword(search_word):
                 continue
 
             # Get wordnet-pos. Ignore words with no wordnet pos tag
@@ -67,21 +80,22 @@ class TextParser:
                 continue
 
             # If lemma is not a stop-word, use that instead of lowercase token
-            lemma = LEMMATIZER.lemmatize(search_word, pos)
-            if lemma not in STOPWORDS:
+            lemma = nlp.lemmatize_word(search_word, pos)
+            if not STOPWORD_SERVICE.is_stopword(lemma):
                 search_word = lemma
 
             # Get lexical units matching the search word and pos
             search_word = nlp.normalize_text(search_word, lemmatize=False, ignore_num=True).replace('.', '')
 
-            # Load frames for missing tokens from FrameNet if it does not exist in cache
+            # Load frames for missing tokens from the FrameNet LU index if it does not exist in cache
             key = '%s__%s' % (search_word, pos)
-            if key not in frame_cache:
-                frame_cache[key] = sorted(
-                    set(lu.frame.name for lu in fn.lus(r'(?i)(^|\s)(%s)(\s.+)?\.%s' % (search_word, pos))))
+            frames = frame_cache.get(key)
+            if frames is None:
+                frames = get_frame_index().get_frames(search_word, pos)
+                frame_cache[key] = frames
 
             # add the frames from current key to the results set
-            results.update(frame_cache[key])
+            results.update(frames)
         if verbose:
             print('Frames: %d' % len(results))
         else:
@@ -184,4 +198,4 @@ class TextParser:
 
     @staticmethod
     def extract_important_tokens(text: str) -> str:
-        return ' '.join(sorted(set(x for x in text.split() if x not in STOPWORDS)))
+        return ' '.join(sorted(set(STOPWORD_SERVICE.filter_tokens(text.split()))))
@@ -0,0 +1,31 @@
+# Pre-forking production server configurations. Usage: gunicorn -c gunicorn.conf.py wsgi:application
+import config
+from core.services import StanfordServer
+
+bind = '%s:%d' % (config.production['host'], config.production['port'])
+workers = config.production['workers']
+threads = config.production['threads']
+# load the app in the master process, before forking the workers
+preload_app = True
+
+TAGGER_SERVERS = []
+
+
+def on_starting(server):
+    # start the tagger servers once, in the master process. workers are spread across them
+    if config.tagger['backend'] == 'stanford':
+        for i in range(config.production['tagger_servers']):
+            tagger_server = StanfordServer(port=config.production['tagger_base_port'] + i)
+            tagger_server.__enter__()
+            TAGGER_SERVERS.append(tagger_server)
+
+
+def post_fork(server, worker):
+    # open the connections of the worker, and assign it a tagger server
+    tagger_port = config.production['tagger_base_port'] + worker.age % max(config.production['tagger_servers'], 1)
+    server.app.wsgi().after_fork(tagger_port=tagger_port)
+
+
+def on_exit(server):
+    for tagger_server in TAGGER_SERVERS:
+        tagger_server.__exit__(None, None, None)
@@ -136,6 +136,8 @@ pip install -U -r requirements.txt
 # Download NLTK dependencies inside virtual environment
 echo "configuring nltk data"
 python config.py
+echo "building FrameNet LU index"
+python -m core.parsers.frame_index
 echo "closing virtual environment..."
 deactivate
 echo "DONE!"
\ No newline at end of file
@@ -6,6 +6,11 @@ cd "${0%/*}"
 echo "Activating virtual environment"
 source env/bin/activate
 echo "Starting Semantic KB"
-nohup python app.py > app.log 2> app.err < /dev/null &
+# "./start.sh production" pre-forks multiple workers (see gunicorn.conf.py)
+if [[ "$1" == "production" ]]; then
+    nohup gunicorn -c gunicorn.conf.py wsgi:application > app.log 2> app.err < /dev/null &
+else
+    nohup python app.py > app.log 2> app.err < /dev/null &
+fi
 echo "Semantic KB started. Deactivating virtual environment..."
 deactivate
\ No newline at end of file
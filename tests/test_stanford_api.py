@@ -0,0 +1,135 @@
+import asyncio
+import socketserver
+import threading
+import unittest
+
+from core.api.stanford_api import (AsyncStanfordAPI, StanfordAPI)
+
+
+def tag_line(line: bytes) -> bytes:
+    # answer of a tagger server with -outputFormat slashTags -tagSeparator __, tagging every token as NN
+    return b' '.join(token + b'__NN' for token in line.split()) + b'\n'
+
+
+class OneShotHandler(socketserver.StreamRequestHandler):
+    # like the stock MaxentTaggerServer: read one line (through an 8KB buffer), answer it and close the connection
+    rbufsize = 8192
+
+    def handle(self):
+        line = self.rfile.readline()
+        if line.strip() != b'':
+            self.wfile.write(tag_line(line))
+
+
+class KeepAliveHandler(socketserver.StreamRequestHandler):
+    # answer every line, and keep the connection open until the client closes it
+    def handle(self):
+        self.server.connections += 1
+        for line in self.rfile:
+            self.wfile.write(tag_line(line))
+            self.wfile.flush()
+
+
+class TaggerServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, handler) -> None:
+        super().__init__(('127.0.0.1', 0), handler)
+        self.connections = 0
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    def shutdown_request(self, request) -> None:
+        # close without shutting down writes first, like the java server, so that closing with unread requests resets
+        # the connection
+        self.close_request(request)
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+def make_sentences(count: int) -> list:
+    # about 200 bytes per sentence, so that batches of 50 or more exceed the read buffer of the server
+    return ['sentence %d %s' % (i, ' '.join('word%d' % j for j in range(30))) for i in range(count)]
+
+
+def expected_tags(sentences: list) -> list:
+    return [[(token, 'NN') for token in sentence.split()] for sentence in sentences]
+
+
+class StanfordAPITest(unittest.TestCase):
+    def test_one_shot_server(self):
+        server = TaggerServer(OneShotHandler)
+        try:
+            api = StanfordAPI(port=server.port, timeout=5)
+            for count in (5, 50, 150):
+                sentences = make_sentences(count)
+                self.assertEqual(api.pos_tag_many(sentences), expected_tags(sentences))
+            self.assertFalse(api.keep_alive)
+            api.close()
+        finally:
+            server.stop()
+
+    def test_keep_alive_server(self):
+        server = TaggerServer(KeepAliveHandler)
+        try:
+            api = StanfordAPI(port=server.port, timeout=5)
+            sentences = make_sentences(50)
+            self.assertEqual(api.pos_tag_many(sentences), expected_tags(sentences))
+            self.assertTrue(api.keep_alive)
+            self.assertEqual(server.connections, 1)
+            api.close()
+        finally:
+            server.stop()
+
+    def test_no_server_response(self):
+        server = TaggerServer(socketserver.BaseRequestHandler)
+        try:
+            api = StanfordAPI(port=server.port, timeout=5)
+            self.assertRaises(IOError, api.pos_tag_many, ['sentence'])
+        finally:
+            server.stop()
+
+
+class AsyncStanfordAPITest(unittest.TestCase):
+    def test_one_shot_server(self):
+        server = TaggerServer(OneShotHandler)
+
+        async def run():
+            api = AsyncStanfordAPI(port=server.port, timeout=5)
+            for count in (5, 50, 150):
+                sentences = make_sentences(count)
+                self.assertEqual(await api.pos_tag_many(sentences), expected_tags(sentences))
+            self.assertFalse(api.keep_alive)
+            api.close()
+
+        try:
+            asyncio.run(run())
+        finally:
+            server.stop()
+
+    def test_keep_alive_server(self):
+        server = TaggerServer(KeepAliveHandler)
+
+        async def run():
+            api = AsyncStanfordAPI(port=server.port, timeout=5)
+            sentences = make_sentences(50)
+            self.assertEqual(await api.pos_tag_many(sentences), expected_tags(sentences))
+            self.assertTrue(api.keep_alive)
+            api.close()
+
+        try:
+            asyncio.run(run())
+            self.assertEqual(server.connections, 1)
+        finally:
+            server.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,17 @@
+"""
+WSGI entry point of the production server. With gunicorn.conf.py, the app (frame cache, entity index, postings index
+and heading features) is loaded once in the master process, and shared copy-on-write by the pre-forked workers.
+
+Usage: gunicorn -c gunicorn.conf.py wsgi:application
+"""
+import gc
+
+from app import App
+
+application = App(__name__)
+application.before_fork()
+# move the loaded objects out of the generations tracked by the garbage collector, so that collections in the workers
+# do not write to (and copy) the shared pages
+if hasattr(gc, 'freeze'):
+    gc.collect()
+    gc.freeze()